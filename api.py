@@ -0,0 +1,169 @@
+import json
+import traceback
+from datetime import date
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from catalog import CSV_FILE_PATH, get_catalog
+from duplicates import collapse_near_duplicates, get_duplicate_index
+from metrics import metrics_application, timed
+from search import (FILTER_ACTIONS, FILTER_ACTIVITIES, SEARCH_MODES, describe_results, filter_images, get_num_results,
+                    parse_search_query, search_images)
+
+# JSON search API: gunicorn -c gunicorn.conf.py api:application
+#   GET /search?q=MS Dhoni batting&mode=Filters
+#   GET /filter?players=Ms Dhoni,Ravindra Jadeja&action=Batting&activity=Day&from=2023-05-01&to=2023-05-31&faces=2
+#   Both take collapse=1 to keep one image of each group of near-duplicates
+#   GET /together?player=Ms Dhoni&top=5 (players most often in the same images)
+#   GET /metrics (Prometheus text format; every gunicorn worker keeps its own counters)
+
+load_dotenv()
+
+
+class BadRequest(Exception):
+    pass
+
+
+# Function to load the catalog and build its indexes before gunicorn forks the workers,
+# so every worker starts with them in copy-on-write memory
+def preload(path=CSV_FILE_PATH):
+    catalog = get_catalog(path)
+    catalog.search_index
+    catalog.records
+    catalog.caption_index
+    catalog.query_parser
+    catalog.player_index
+    catalog.url_player_index
+    catalog.semantic_index
+    get_duplicate_index(catalog)
+    return catalog
+
+
+def get_param(params, name, default=None):
+    values = params.get(name)
+    return values[0].strip() if values else default
+
+
+# Function to get an optional parameter that must be one of the filter tab's choices, matched without case
+def get_choice_param(params, name, choices):
+    value = get_param(params, name)
+    if not value:
+        return None
+    for choice in choices:
+        if choice.lower() == value.lower():
+            return choice
+    raise BadRequest(f"'{name}' must be one of {', '.join(choices)}")
+
+
+def get_flag_param(params, name):
+    return get_param(params, name, "0").lower() in ("1", "true", "yes")
+
+
+def get_date_param(params, name):
+    value = get_param(params, name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a date in YYYY-MM-DD format")
+
+
+def handle_search(params):
+    user_query = get_param(params, "q")
+    if not user_query:
+        raise BadRequest("'q' is required")
+    search_mode = get_param(params, "mode", "Filters").capitalize()
+    if search_mode not in SEARCH_MODES:
+        raise BadRequest(f"'mode' must be one of {', '.join(SEARCH_MODES)}")
+    catalog = get_catalog(CSV_FILE_PATH)
+    if search_mode == "Semantic" and catalog.semantic_index is None:
+        raise BadRequest("The semantic index has not been built")
+    parsed_query = parse_search_query(catalog, user_query, search_mode)
+    if parsed_query is None:
+        raise BadRequest("Valid JSON not found in the response.")
+    result_urls = search_images(catalog, user_query, parsed_query, search_mode)
+    if get_flag_param(params, "collapse"):
+        result_urls = collapse_near_duplicates(catalog, result_urls)
+    return {
+        "query": user_query,
+        "mode": search_mode,
+        "parsed": parsed_query,
+        "num_results": get_num_results(user_query),
+        "total": len(result_urls),
+        "results": describe_results(catalog, result_urls),
+    }
+
+
+def handle_filter(params):
+    # Players may be given as players=A,B or as repeated players= parameters
+    players = [player.strip() for value in params.get("players", []) for player in value.split(",") if player.strip()]
+    if not players:
+        raise BadRequest("'players' is required")
+    try:
+        no_of_faces = int(get_param(params, "faces", "0"))
+    except ValueError:
+        raise BadRequest("'faces' must be a number")
+    catalog = get_catalog(CSV_FILE_PATH)
+    result_urls = filter_images(
+        catalog,
+        players,
+        action=get_choice_param(params, "action", FILTER_ACTIONS),
+        activity=get_choice_param(params, "activity", FILTER_ACTIVITIES),
+        from_date=get_date_param(params, "from"),
+        to_date=get_date_param(params, "to"),
+        no_of_faces=no_of_faces,
+    )
+    if get_flag_param(params, "collapse"):
+        result_urls = collapse_near_duplicates(catalog, result_urls)
+    return {"players": players, "total": len(result_urls), "results": describe_results(catalog, result_urls)}
+
+
+def handle_together(params):
+    player = get_param(params, "player")
+    if not player:
+        raise BadRequest("'player' is required")
+    try:
+        top = int(get_param(params, "top", "5"))
+    except ValueError:
+        raise BadRequest("'top' must be a number")
+    player_index = get_catalog(CSV_FILE_PATH).player_index
+    if player not in player_index.code:
+        raise BadRequest(f"Unknown player '{player}'")
+    return {
+        "player": player,
+        "images": len(player_index.postings[player_index.code[player]]),
+        "together": [{"player": other, "images": images} for other, images in player_index.most_with(player, top)],
+    }
+
+
+ROUTES = {
+    "/search": handle_search,
+    "/filter": handle_filter,
+    "/together": handle_together,
+}
+
+
+# WSGI entry point
+def application(environ, start_response):
+    if environ.get("PATH_INFO", "") == "/metrics":
+        return metrics_application(environ, start_response)
+    handler = ROUTES.get(environ.get("PATH_INFO", ""))
+    if handler is None:
+        status, body = "404 Not Found", {"error": "Not found"}
+    elif environ.get("REQUEST_METHOD", "GET") != "GET":
+        status, body = "405 Method Not Allowed", {"error": "Only GET is supported"}
+    else:
+        try:
+            with timed("api_request", route=environ["PATH_INFO"]):
+                status, body = "200 OK", handler(parse_qs(environ.get("QUERY_STRING", "")))
+        except BadRequest as e:
+            status, body = "400 Bad Request", {"error": str(e)}
+        except Exception as e:
+            traceback.print_exc()
+            status, body = "500 Internal Server Error", {"error": f"An error occurred: {e}"}
+    payload = json.dumps(body, default=str).encode("utf-8")
+    start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(payload)))])
+    return [payload]
+
+
+preload()
@@ -1,135 +1,156 @@
-import streamlit as st
-import pandas as pd
-import google.generativeai as genai
-import json
-import re
-import requests
-from PIL import Image
-import io
+import asyncio
 import os
+import streamlit as st
 from dotenv import load_dotenv
 from datetime import date
-import time
+from catalog import CSV_FILE_PATH, get_catalog
+from duplicates import collapse_near_duplicates, get_duplicate_index
+from facets import FacetSelection, facet_counts
+from images import PAGE_DEADLINE, fetch_thumbnails, get_thumbnail_cache, prefetch_thumbnails
+from metrics import get_counters, start_metrics_server, start_trace, timed
+from placeholders import get_placeholder
+from records import get_drive_file_id, local_thumbnail_key
+from search import AVAILABLE_PLAYERS, FILTER_ACTIONS, FILTER_ACTIVITIES, get_num_results, filter_images, images_of_players
+from search_pipeline import run_text_search
  
-# Load environment variables and configure Gemini
+# Load environment variables (API_KEY for Gemini)
 load_dotenv()
-api_key = os.getenv("API_KEY")
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-1.5-flash")
-# Path to the CSV file
-CSV_FILE_PATH = "repo1.csv"
-# Existing functions here (parse_query_with_gemini, filter_images_by_players_and_action, etc.)
-def parse_query_with_gemini(user_query):
-    prompt = f"""
-    You are an assistant for a sports analytics platform. Parse the following query into structured parameters:
-    Query: "{user_query}"
-    Output format:
-    {{"Players": [List of player names], "Action": "Action type" Any one of the given(posing, walking, playing, bowling, batting, observing, speaking, celebrating, discussion, award ceremony, sitting, standing, laughing, smiling, eating, event, departure, greeting, running, cheering)(optional), "Environment": "Environment type (optional)", "Day/Night": "Day or Night (optional)", "ShotType": "Type of shot (optional)", "Date": "Date (optional)", "Location": "Location (optional)", "Results": "Number of results (optional)"}}
-    """
-    response = model.generate_content(prompt)
-    return response.text
-# Updated function to filter the DataFrame
-def filter_images_by_players_and_action(df, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None):
-    grouped = df.groupby("ID").agg(
-        {"Name": lambda x: set(x), "URL": "first", "Action": lambda x: set(x), "Environment": "first",
-         "Day/Night": "first", "ShotType": "first", "Date": "first", "Location": "first" if "Location" in df.columns else lambda x: None}
-    )
-    # Start with all rows
-    result = grouped
-    # Check for generic player terms
-    generic_terms = {"players", "person", "people"}
-    if players and not generic_terms.intersection(set(map(str.lower, players))):
-        result = result[result["Name"].apply(lambda x: set(players).issubset(x))]
-    # Filter by action if specified
-    if action:
-        result = result[result["Action"].apply(lambda x: action in x)]
-    # Filter by environment if specified
-    if environment:
-        if "Environment" in df.columns:
-            result = result[result["Environment"].str.contains(environment, case=False, na=False)]
-    # Filter by day/night if specified
-    if day_night:
-        if "Day/Night" in df.columns:
-            result = result[result["Day/Night"].str.contains(day_night, case=False, na=False)]
-    # Filter by shot type if specified
-    if shot_type:
-        if "ShotType" in df.columns:
-            result = result[result["ShotType"].str.contains(shot_type, case=False, na=False)]
-    # Filter by date if specified
-    if date:
-        if "Date" in df.columns:
-            result = result[result["Date"].str.contains(date, case=False, na=False)]
-    # Filter by location if specified
-    if location:
-        if "Location" in df.columns:
-            result = result[result["Location"].str.contains(location, case=False, na=False)]
-    return result["URL"].tolist()
+# Serve Prometheus metrics on METRICS_PORT when it is set
+start_metrics_server()
+# Images shown per page of the text search: 2 rows of 3
+GRID_ROWS = 2
+GRID_COLS = 3
+GRID_CELLS = GRID_ROWS * GRID_COLS
+# Function to get the Drive file IDs of the images shown from start_idx onwards
+def get_page_file_ids(urls, start_idx, count):
+    if start_idx < 0:
+        return []
+    return [get_drive_file_id(url) for url in urls[start_idx:start_idx + count] if "drive.google.com" in url]
+ 
+# Function to warm the thumbnail cache in the background for a tab, replacing that tab's previous prefetch
+def start_prefetch(tab, file_ids):
+    if "prefetch_jobs" not in st.session_state:
+        st.session_state.prefetch_jobs = {}
+    cancel_prefetch(tab)
+    st.session_state.prefetch_jobs[tab] = prefetch_thumbnails(file_ids)
+ 
+# Function to stop a tab's prefetch, e.g. when a new query makes it useless
+def cancel_prefetch(tab):
+    job = st.session_state.get("prefetch_jobs", {}).pop(tab, None)
+    if job is not None:
+        job.cancel()
  
-# Function to extract view URL and direct image URL from Google Drive URL
-def get_drive_view_url_and_direct_link(url):
-    file_id = url.split("/")[-2]  # Extract file ID from Google Drive URL
-    view_link = f"https://drive.google.com/file/d/{file_id}/view"
-    direct_link = f"https://drive.google.com/uc?id={file_id}"
-    return view_link, direct_link
+# Function to fill a grid cell with a blurred preview of its image until the thumbnail arrives.
+# Cells whose thumbnail is already cached are left empty, since it is drawn straight away.
+def show_placeholder(catalog, record, placeholder):
+    if get_thumbnail_cache().contains(record.file_id):
+        return
+    preview = get_placeholder(catalog, record)
+    if preview is not None:
+        placeholder.image(preview, use_container_width=True)
  
-# Function to fetch the image with retry logic
-def fetch_image_with_retry(direct_link, retries=3):
-    for _ in range(retries):
-        try:
-            response = requests.get(direct_link)
-            if response.status_code == 200:
-                return response.content
-        except Exception as e:
-            print(f"Error fetching image: {e}")
-    return None
+# Function to show an image that is not on Drive, such as a photo ingested from a local folder, from the
+# thumbnail ingest.py cached for it, else from the file itself. Returns False when there is neither.
+def show_local_image(record, container):
+    thumbnail = get_thumbnail_cache().get(local_thumbnail_key(record.url))
+    if thumbnail is None and not os.path.isfile(record.url):
+        return False
+    container.image(thumbnail if thumbnail is not None else record.url, use_container_width=True)
+    container.caption(record.id)
+    return True
  
 # Function to display results as a grid of 2 rows and 3 columns
 def display_results():
     current_page = st.session_state.current_page
     num_results = st.session_state.num_results
     result_urls = st.session_state.result_urls
-    df = pd.read_csv(CSV_FILE_PATH)  # Load the CSV file to retrieve captions
+    catalog = get_catalog(CSV_FILE_PATH)
+    records = catalog.records  # Per-image records, used to retrieve captions
     start_idx = current_page * num_results
     end_idx = start_idx + num_results
     st.write(f"Displaying results {start_idx + 1} to {min(end_idx, len(result_urls))}:")
     current_results = result_urls[start_idx:end_idx]
     # Create 2 rows of results
-    rows = 2
-    cols = 3
-    num_cells = rows * cols
+    rows = GRID_ROWS
+    cols = GRID_COLS
+    num_cells = GRID_CELLS
     current_results = current_results[:num_cells]
  
+    # Lay out the grid first so every cell has a placeholder to render into
+    drive_cells = []
     for row_idx in range(rows):
         cols_in_row = st.columns(cols)
         start_idx_in_row = row_idx * cols
         end_idx_in_row = start_idx_in_row + cols
         for col_idx, (url, col) in enumerate(zip(current_results[start_idx_in_row:end_idx_in_row], cols_in_row)):
-            with col:
-                if "drive.google.com" in url:
-                    view_link, direct_link = get_drive_view_url_and_direct_link(url)
-                    image_content = fetch_image_with_retry(direct_link)
-                    if image_content:
-                        image = Image.open(io.BytesIO(image_content))
-                        col.image(image, use_container_width=True)
+            record = records.by_url.get(url)
+            if record is not None and record.file_id:
+                drive_cells.append((record, col.empty()))
+                show_placeholder(catalog, record, drive_cells[-1][1])
+            elif record is None or not show_local_image(record, col):
+                col.write(f"Invalid URL: {url}")
+    # Get all thumbnails of the page (cached or downloaded in parallel) and render each one as soon as it is ready.
+    # Images still downloading after PAGE_DEADLINE keep their placeholder, so a slow link cannot hold up the controls.
+    for position, thumbnail in fetch_thumbnails([record.file_id for record, placeholder in drive_cells], deadline=PAGE_DEADLINE):
+        record, placeholder = drive_cells[position]
+        if thumbnail:
+            with placeholder.container():
+                st.image(thumbnail, use_container_width=True)
  
-                        # Fetch the caption for the current URL
-                        caption_row = df[df['URL'] == url]
-                        caption = caption_row["Captions"].iloc[0] if not caption_row.empty and "Captions" in df.columns else "No caption available"
-                       
-                        # Display the caption
-                        #col.write(f"**{caption}**")
-                       
-                        # Add a link to open in Google Drive
-                        col.markdown(f'<a href="{view_link}" target="_blank" style="color: blue;">Open in Google Drive</a>', unsafe_allow_html=True)
-                    else:
-                        col.write("Error fetching image.")
-                else:
-                    col.write(f"Invalid URL: {url}")
+                # The caption for the current URL comes straight from its record
+                caption = record.captions[0] if record.captions else "No caption available"
+               
+                # Display the caption
+                #st.write(f"**{caption}**")
+               
+                # Add a link to open in Google Drive
+                st.markdown(f'<a href="{record.view_link}" target="_blank" style="color: blue;">Open in Google Drive</a>', unsafe_allow_html=True)
+        else:
+            placeholder.write("Error fetching image.")
+    # Warm the cache for the next page, then the previous one, while the user looks at this one
+    start_prefetch("text", get_page_file_ids(result_urls, end_idx, num_cells)
+                   + get_page_file_ids(result_urls, start_idx - num_results, num_cells))
     if end_idx >= len(result_urls):
         st.write("No more results to display.")
  
+# Function to get this session's facet selection, rebuilt when the catalog changes
+def get_facet_selection(catalog):
+    selection = st.session_state.get("facet_selection")
+    if selection is None or selection.index is not catalog.facet_index:
+        selection = FacetSelection(catalog.facet_index)
+        st.session_state.facet_selection = selection
+    return selection
+ 
+# Function to label a filter option with the number of images it would return, when it has a count
+def with_count(option, count):
+    return option if count is None else f"{option} ({count})"
+ 
+# Function to show the timings of the last search and the process counters, when the page is opened with ?debug=1
+def show_debug_panel(trace):
+    if st.query_params.get("debug") != "1":
+        return
+    if trace:
+        st.session_state.last_trace = trace
+    with st.sidebar.expander("Debug", expanded=True):
+        st.write("##### Last request")
+        if st.session_state.get("last_trace"):
+            st.dataframe(st.session_state.last_trace, use_container_width=True, hide_index=True)
+        else:
+            st.write("No timed stages yet.")
+        st.write("##### Counters")
+        counters = [{"metric": name, **dict(labels), "value": value} for (name, labels), value in sorted(get_counters().items())]
+        st.dataframe(counters, use_container_width=True, hide_index=True)
+ 
 # --- Main Streamlit app with tabs ---
 def app():
+    # Collect the timings of every stage run for this interaction
+    trace = start_trace()
+    try:
+        main_page()
+    finally:
+        show_debug_panel(trace)
+ 
+def main_page():
     custom_html = """
     <style>
         .banner {
@@ -151,13 +172,25 @@ def app():
     """
     st.markdown(custom_html, unsafe_allow_html=True)
     st.title("Image Search Application")
-    df = pd.read_csv(CSV_FILE_PATH)
+    catalog = get_catalog(CSV_FILE_PATH)
     # Create two tabs
     tab1, tab2 = st.tabs(["Text-based Search", "Filter-based Search"])
     # Tab 1: Search Images
     with tab1:
         st.markdown("Find images based on Player Names, Action, Environment")
         user_query = st.text_input("Enter your query:")
+        search_modes = ["Filters", "Captions"]
+        if catalog.semantic_index is not None:
+            search_modes.append("Semantic")
+        search_mode = st.radio(
+            "Search mode",
+            search_modes,
+            horizontal=True,
+            help="Filters: Gemini-parsed players and actions. Captions: rank by caption words, without Gemini. "
+                 "Semantic: closest captions in meaning, within the Gemini-parsed filters.",
+        )
+        hide_duplicates = st.checkbox("Hide near-duplicates", value=True, key="hide_duplicates_text",
+                                      help="Show one image of each burst of almost identical shots.")
         if "current_page" not in st.session_state:
             st.session_state.current_page = 0
         if "query_submitted" not in st.session_state:
@@ -167,41 +200,25 @@ def app():
         if "num_results" not in st.session_state:
             st.session_state.num_results = 6
         if st.button("Submit"):
+            cancel_prefetch("text")
             st.session_state.current_page = 0
             st.session_state.query_submitted = True
             if user_query:
                 try:
-                    parsed_query_raw = parse_query_with_gemini(user_query)
-                    cleaned_response = parsed_query_raw.strip("```").strip()
-                    start_idx = cleaned_response.find("{")
-                    end_idx = cleaned_response.rfind("}") + 1
-                    valid_json = cleaned_response[start_idx:end_idx]
-                    if valid_json:
-                        parsed_query = json.loads(valid_json)
-                    else:
-                        st.error("Valid JSON not found in the response.")
-                        return
-                    query_players = parsed_query.get("Players", [])
-                    query_action = parsed_query.get("Action", None)
-                    query_environment = parsed_query.get("Environment", None)
-                    query_day_night = parsed_query.get("Day/Night", None)
-                    query_shot_type = parsed_query.get("ShotType", None)
-                    query_date = parsed_query.get("Date", None)
-                    query_location = parsed_query.get("Location", None)
- 
-                    match = re.search(r"\b(\d+)\s*images?\b", user_query)
-                    num_results = int(match.group(1)) if match else 6
- 
-                    result_urls = filter_images_by_players_and_action(
-                        df, query_players, query_action, query_environment, query_day_night,
-                        query_shot_type, query_date, query_location
-                    )
-                    st.session_state.result_urls = result_urls
-                    st.session_state.num_results = num_results
-                    if result_urls:
-                        display_results()
-                    else:
-                        st.write("No matching images found.")
+                    with timed("submit", mode=search_mode):
+                        num_results = get_num_results(user_query)
+                        # Parsing, searching and the first page's downloads overlap (see search_pipeline.py)
+                        result_urls = asyncio.run(run_text_search(catalog, user_query, search_mode, hide_duplicates,
+                                                                  page_size=min(num_results, GRID_CELLS)))
+                        if result_urls is None:
+                            st.error("Valid JSON not found in the response.")
+                            return
+                        st.session_state.result_urls = result_urls
+                        st.session_state.num_results = num_results
+                        if result_urls:
+                            display_results()
+                        else:
+                            st.write("No matching images found.")
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
         # Pagination
@@ -224,16 +241,31 @@ def app():
             st.session_state.players = []
         if "display_index" not in st.session_state:
             st.session_state.display_index = 0
-        available_players = ["Mitchell Santner", "Nishant Sindhu", "Moeen Ali", "Ajay Mandal", "Ben Stokes",
-            "Ajinkya Rahane", "Shivam Dube", "Deepak Chahar", "Devon Conway", "Maheesh Theekshana",
-            "R Russell", "Akash Singh", "Gregory King", "Lakshmi", "Tushar Deshpande", "Ms Dhoni",
-            "Suresh Raina", "Ruturaj Gaikwad", "Simarjeet Singh", "Ravindra Jadeja", "Eric Simon",
-            "Shaik Rasheed", "Stephen Fleming", "Subhranshu Senapati", "Dwayne Bravo", "Ambati Rayudu",
-            "Bhagath Varma", "Tommy Simsek", "Sanjay Natarajan", "Prashant Solanki", "Rajvardhan Hangargekar",
-            "Dwaine Pretorius", "Matheesha Pathirana", "Mukesh Choudhary", "Kasi", "Gerald Coetzee",
-            "David Miller", "Faf Du Plessis", "Lahiru Milantha", "Imran Tahir", "Saiteja Mukkamalla",
-            "Rusty Theron", "Cameron Stevenson", "Zia Shahzad", "Cody Chetty", "Milind Kumar",
-            "Sami Aslam", "Calvin Savage", "Muhammad Mohsin", "Zia Ul Haq"]
+        # The catalog's first and last day, so the default date range covers every image
+        first_date, last_date = catalog.facet_index.date_range or (date.today(), date.today())
+        # Options are labelled with counts for the current choices. The widgets' values are already in the
+        # session state when the script starts, so the counts are computed from them before anything is drawn.
+        choices = {
+            "players": list(st.session_state.players),
+            "action": st.session_state.get("facet_action", "Unspecified"),
+            "activity": st.session_state.get("facet_activity", "Unspecified"),
+            "from_date": st.session_state.get("facet_from_date", first_date),
+            "to_date": st.session_state.get("facet_to_date", last_date),
+            "no_of_faces": st.session_state.get("facet_no_of_faces", 0),
+            "hide_duplicates": st.session_state.get("hide_duplicates_filter", True),
+        }
+        facet_selection = get_facet_selection(catalog)
+        facet_selection.sync(choices["players"])
+        counts = facet_counts(
+            facet_selection,
+            action=choices["action"] if choices["action"] != "Unspecified" else None,
+            activity=choices["activity"] if choices["activity"] != "Unspecified" else None,
+            from_date=choices["from_date"],
+            to_date=choices["to_date"],
+            no_of_faces=choices["no_of_faces"],
+            # Near-duplicates count once when Find Image will hide them, so the counts match what it shows
+            url_groups=catalog.facet_index.url_groups(get_duplicate_index(catalog)) if choices["hide_duplicates"] else None,
+        )
          # Function to add a player
         def add_player():
             new_player = st.session_state.new_player
@@ -250,7 +282,8 @@ def app():
         with col1:
             st.selectbox(
                 " ",
-                options=[""] + available_players,
+                options=[""] + AVAILABLE_PLAYERS,
+                format_func=lambda player: with_count(player, counts["Players"].get(player)),
                 key="new_player",
                 on_change=add_player,
                 label_visibility="collapsed",
@@ -259,9 +292,13 @@ def app():
         st.write("##### Selection List")
         if st.session_state.players:
             for player in st.session_state.players:
-                # Create a button with "✖️" to remove player
-                if st.button(f"✖️ {player}", key=f"remove_{player}"):
-                    remove_player(player)
+                # Create a button with "✖️" to remove player; removed before the next run, so the counts follow
+                st.button(f"✖️ {player}", key=f"remove_{player}", on_click=remove_player, args=(player,))
+            # Suggest the players most often pictured with the last one added
+            together = catalog.player_index.most_with(st.session_state.players[-1])
+            if together:
+                st.caption(f"Often pictured with {st.session_state.players[-1]}: "
+                           + ", ".join(f"{player} ({images})" for player, images in together))
         else:
             st.info("No players added yet. Please add players to proceed.")
         # Input for location
@@ -270,26 +307,34 @@ def app():
         with col5:
             Action = st.selectbox(
                 "ACTION",
-                ["Unspecified", "Award Ceremony", "Batting", "Bowling", "Catching", "Cheering", "Departure",  "Eating", "Event", "Greeting", "Holding Signs", "Hugging", "Laughing",     "Observing", "Playing", "Posing", "Practicing", "Receiving", "Running",     "Smiling", "Speaking", "Standing", "Sitting", "Warm Up", "Walking" ],
+                ["Unspecified"] + FILTER_ACTIONS,
+                index=(["Unspecified"] + FILTER_ACTIONS).index(choices["action"]),
+                format_func=lambda action: with_count(action, counts["Action"][None if action == "Unspecified" else action]),
+                key="facet_action",
                 label_visibility="visible",
             )
         with col6:
         # Combining Day/Night, Environment, and Distance in a single Location filter dropdown
             activity = st.selectbox(
                 "ACTIVITY",
-                ["Unspecified", "Day","Night","Outdoor","Indoor","Unknown","Close"],
+                ["Unspecified"] + FILTER_ACTIVITIES,
+                index=(["Unspecified"] + FILTER_ACTIVITIES).index(choices["activity"]),
+                format_func=lambda activity: with_count(activity, counts["Activity"][None if activity == "Unspecified" else activity]),
+                key="facet_activity",
                 label_visibility="visible"
             )
         with col8:
             start_date = st.date_input(
                 "From Date",
-                date.today(),
+                first_date,
+                key="facet_from_date",
                 label_visibility="visible",
             )
         with col9:
             end_date = st.date_input(
                 "To Date",
-                date.today(),
+                last_date,
+                key="facet_to_date",
                 label_visibility="visible",
             )
         with col10:
@@ -298,84 +343,33 @@ def app():
                 min_value=0,
                 value=0,  # Default value
                 step=1,
+                key="facet_no_of_faces",
                 label_visibility="visible",
             )
-        # Function to filter dataframe based on action
-        def filter_by_Action(df, action="all"):
-            if "Action" in df.columns:
-                if action != "all":
-                    # Check if the Caption contains the selected action keyword (case-insensitive)
-                    return df[df["Action"].str.contains(action, case=False, na=False)]
-                else:
-                    # If no action is provided, return the dataframe unfiltered
-                    return df
-            else:
-                st.warning("The uploaded CSV does not contain a 'action' column. Please include it.")
-                return df
-        # Function to filter dataframe based on place
-        def filter_by_no_of_faces(df, no_of_faces=0):
-            if "No_of_faces" in df.columns:
-                return df[df["No_of_faces"] == no_of_faces]
-            else:
-                st.warning("The uploaded CSV does not contain a 'No_of_faces' column. Please include it.")
-                return df
-        # Function to filter dataframe based on location
-        def filter_by_activity(df, day_night=None, environment=None, distance=None):
-            if day_night and "Day_Night" in df.columns:
-                df = df[df["Day_Night"].str.contains(day_night, case=False, na=False)]
-            if environment and "Environment" in df.columns:
-                df = df[df["Environment"].str.contains(environment, case=False, na=False)]
-            if distance and "Distance" in df.columns:
-                df = df[df["Distance"].str.contains(distance, case=False, na=False)]
-            return df
-        def filter_by_date(df, from_date, to_date):
-            if "Date" in df.columns:
-                # Convert the 'Date' column to pandas datetime with infer_datetime_format for flexible formats
-                df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-                # Convert Streamlit date inputs to pandas datetime
-                from_date = pd.to_datetime(from_date.strftime("%Y-%m-%d"))
-                to_date = pd.to_datetime(to_date.strftime("%Y-%m-%d"))
-                # Filter the DataFrame for dates within the specified range
-                return df[(df["Date"] >= from_date) & (df["Date"] <= to_date)]
-            else:
-                st.warning("The uploaded CSV does not contain a 'Date' column. Please include it.")
-                return df
-               
-        # Function to filter players with the same URL
-        def filter_by_same_url(df):
-            # Group by URL and filter groups where all players in the group have the same URL
-            grouped = df.groupby("URL").nunique()
-            valid_urls = grouped[grouped > 1].index  # URLs with more than one unique name
-            return df[df["URL"].isin(valid_urls)]
-        # Functionality for the yellow button
+        if st.session_state.players:
+            st.caption(f"{counts['total']} images match the current selection")
+        hide_duplicates = st.checkbox("Hide near-duplicates", value=True, key="hide_duplicates_filter",
+                                      help="Show one image of each burst of almost identical shots.")
         # Functionality for the yellow button
         if st.button("Find Image", key="yellow_button"):
             st.session_state.display_index = 0  # Reset index for new generation
+            cancel_prefetch("filter")
             if st.session_state.players and CSV_FILE_PATH:
-                # Filter by selected player names
-                filtered_df = df[df["Name"].isin(st.session_state.players)]
-                # Apply Action filter if it's not set to "All"
-                if Action != "All":
-                    filtered_df = filtered_df[filtered_df["Action"].str.contains(Action, case=False, na=False)]
-                # Apply location filter if it's not "unspecified"
-                if activity != "unspecified":
-                    filtered_df = filter_by_activity(
-                        df=filtered_df,
-                        day_night=activity if activity in ["Day", "Night"] else None,
-                        environment=activity if activity in ["Outdoor", "Indoor"] else None,
-                        distance=activity if activity in ["Close", "Far"] else None
+                with timed("find_image"):
+                    st.session_state.filtered_urls = filter_images(
+                        catalog,
+                        st.session_state.players,
+                        action=Action if Action != "Unspecified" else None,
+                        activity=activity if activity != "Unspecified" else None,
+                        from_date=start_date,
+                        to_date=end_date,
+                        no_of_faces=no_of_faces,
                     )
-                if no_of_faces > 0:
-                    filtered_df = filter_by_no_of_faces(filtered_df, no_of_faces)
-                if start_date and end_date:
-                    filtered_df = filter_by_date(filtered_df, from_date=start_date, to_date=end_date)
-                # Filter to include only players with the same URL (if applicable)
-                filtered_df = filter_by_same_url(filtered_df)
-                # Ensure only unique URLs in the session state
-                st.session_state.filtered_urls = filtered_df["URL"].drop_duplicates().tolist()
-                if not st.session_state.filtered_urls:
-                    # st.warning("No images match the selected filters. Showing all images for selected players.")
-                    st.session_state.filtered_urls = df[df["Name"].isin(st.session_state.players)]["URL"].drop_duplicates().tolist()
+                    if not st.session_state.filtered_urls:
+                        # st.warning("No images match the selected filters. Showing all images for selected players.")
+                        st.session_state.filtered_urls = images_of_players(catalog, st.session_state.players)
+                    if hide_duplicates:
+                        st.session_state.filtered_urls = collapse_near_duplicates(catalog, st.session_state.filtered_urls)
             else:
                 st.warning("No players selected or no CSV uploaded.")
                 st.session_state.filtered_urls = []
@@ -419,45 +413,43 @@ def app():
                 st.error(f"Failed to process Google Drive URL: {url}")
                 st.write(f"Error: {e}")
                 return None
-        def fetch_image_with_retry(direct_url, retries=3, delay=5):
-            for attempt in range(retries):
-                try:
-                    response = requests.get(direct_url, timeout=5)
-                    if response.status_code == 200 and "image" in response.headers.get("Content-Type", ""):
-                        return response.content  # Return the image content
-                    else:
-                        raise Exception(f"Invalid image response: {response.status_code}")
-                except Exception as e:
-                    if attempt < retries - 1:
-                        time.sleep(delay)  # Wait before retrying
-                        continue
-                    else:
-                        st.error(f"Failed to load image after {retries} attempts: {e}")
-                        return None
         # Display images in a grid layout
         if "filtered_urls" in st.session_state and st.session_state.filtered_urls:
             start_index = st.session_state.display_index
             end_index = start_index + 6
             urls_to_display = st.session_state.filtered_urls[start_index:end_index]
             cols = st.columns(3)  # 3 images per row
+            drive_cells = []
             for i, url in enumerate(urls_to_display):
                 with cols[i % 3]:
                     try:
-                        if "drive.google.com" in url:
-                            view_link, direct_link = get_drive_view_url_and_direct_link(url)
-                            if direct_link:
-                                image_content = fetch_image_with_retry(direct_link)
-                                if image_content:
-                                    image = Image.open(io.BytesIO(image_content))
-                                    st.image(image, use_container_width=True)
-                                    if view_link:
-                                        st.markdown(f'<a href="{view_link}" target="_blank" style="color: blue;">Open in Google Drive</a>', unsafe_allow_html=True)
+                        record = catalog.records.by_url.get(url)
+                        if record is not None and record.file_id:
+                            drive_cells.append((record, st.empty()))
+                            show_placeholder(catalog, record, drive_cells[-1][1])
+                        elif record is not None and show_local_image(record, st):
+                            pass
                         else:
                             st.image(url, use_container_width=True)
                             st.markdown(f'<a href="{url}" target="_blank" style="color: blue;">{url}</a>', unsafe_allow_html=True)
                     except Exception as e:
                         st.warning(f"Failed to load image from URL: {url}")
                         st.write(e)
+            # Get the Drive thumbnails (cached or downloaded in parallel) and fill each cell as its image is ready
+            for position, thumbnail in fetch_thumbnails([record.file_id for record, placeholder in drive_cells], deadline=PAGE_DEADLINE):
+                record, placeholder = drive_cells[position]
+                with placeholder.container():
+                    try:
+                        if thumbnail:
+                            st.image(thumbnail, use_container_width=True)
+                            st.markdown(f'<a href="{record.view_link}" target="_blank" style="color: blue;">Open in Google Drive</a>', unsafe_allow_html=True)
+                        else:
+                            st.error(f"Failed to load image: {record.url}")
+                    except Exception as e:
+                        st.warning(f"Failed to load image from URL: {record.url}")
+                        st.write(e)
+            # Warm the cache for the images behind "Load More"
+            start_prefetch("filter", get_page_file_ids(st.session_state.filtered_urls, end_index, 6))
             # Load More Button
             if end_index < len(st.session_state.filtered_urls):
                 if st.button("Load More"):
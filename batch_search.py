@@ -0,0 +1,155 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from catalog import CSV_FILE_PATH, get_catalog
+from metrics import timed
+from query_parser import parse_queries
+from search import (SEARCH_MODES, describe_results, filter_image_bitmap, get_num_results, get_query_filters,
+                    parse_search_query, search_images)
+from search_index import TermCache
+
+# Batch text search: python batch_search.py queries.jsonl results.jsonl [--mode Filters] [--all]
+#   JSONL input: one query per line, either a string or {"query": ..., "id": ..., "mode": ...}
+#   CSV input: a "query" column, with optional "id" and "mode" columns
+#   Output: JSONL (one object per query) or CSV (one row per result), chosen by the output file's extension
+
+# Queries parsed and searched together; results are written out after each chunk
+CHUNK_SIZE = 500
+CSV_OUTPUT_COLUMNS = ["id", "query", "rank", "image_id", "url", "view_link", "players", "error"]
+
+load_dotenv()
+
+
+# Function to read the queries of a JSONL or CSV file ("-" reads JSONL from stdin) as dicts with id, query and mode
+def read_queries(path, default_mode):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as source:
+            for line_number, row in enumerate(csv.DictReader(source), start=1):
+                yield make_query(row, line_number, default_mode)
+        return
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line_number, line in enumerate(source, start=1):
+            if line.strip():
+                value = json.loads(line)
+                yield make_query(value if isinstance(value, dict) else {"query": value}, line_number, default_mode)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def make_query(row, line_number, default_mode):
+    mode = (row.get("mode") or default_mode).capitalize()
+    return {"id": row.get("id") or line_number, "query": str(row.get("query") or "").strip(), "mode": mode}
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Function to search one chunk of queries and return one result dict per query.
+# Gemini only sees the distinct queries the local parser and the cache cannot answer, in batched prompts,
+# and identical filters are evaluated once on bitmaps shared through the term cache.
+def search_chunk(catalog, queries, term_cache, all_results=False):
+    results = [{"id": query["id"], "query": query["query"], "mode": query["mode"]} for query in queries]
+    to_parse = [i for i, query in enumerate(queries) if query["query"] and query["mode"] in ("Filters", "Semantic")]
+    with timed("batch_parse"):
+        parsed_queries = dict(zip(to_parse, parse_queries([queries[i]["query"] for i in to_parse], catalog.query_parser)))
+    urls_by_filters = {}
+    for i, (query, result) in enumerate(zip(queries, results)):
+        if not query["query"]:
+            result["error"] = "Empty query"
+            continue
+        if query["mode"] not in SEARCH_MODES:
+            result["error"] = f"Mode must be one of {', '.join(SEARCH_MODES)}"
+            continue
+        if query["mode"] == "Semantic" and catalog.semantic_index is None:
+            result["error"] = "The semantic index has not been built"
+            continue
+        parsed_query = parsed_queries[i] if i in parsed_queries else parse_search_query(catalog, query["query"], query["mode"])
+        if parsed_query is None:
+            result["error"] = "Valid JSON not found in the response."
+            continue
+        if query["mode"] == "Filters":
+            filters = get_query_filters(parsed_query)
+            key = tuple(tuple(value) if isinstance(value, list) else value for value in filters)
+            if key not in urls_by_filters:
+                urls_by_filters[key] = term_cache.urls_for(filter_image_bitmap(catalog, *filters, index=term_cache))
+            urls = urls_by_filters[key]
+        else:
+            urls = search_images(catalog, query["query"], parsed_query, query["mode"])
+        result["parsed"] = parsed_query
+        result["total"] = len(urls)
+        result["results"] = describe_results(catalog, urls if all_results else urls[:get_num_results(query["query"])])
+    return results
+
+
+class JsonlWriter:
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, result):
+        self.output.write(json.dumps(result, default=str) + "\n")
+
+
+class CsvWriter:
+    def __init__(self, output):
+        self.writer = csv.DictWriter(output, fieldnames=CSV_OUTPUT_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, result):
+        base = {"id": result["id"], "query": result["query"]}
+        if "error" in result or not result["results"]:
+            self.writer.writerow({**base, "error": result.get("error", "")})
+            return
+        for rank, image in enumerate(result["results"], start=1):
+            self.writer.writerow({**base, "rank": rank, "image_id": image.get("id", ""), "url": image["url"],
+                                  "view_link": image.get("view_link", ""), "players": ";".join(image.get("players", []))})
+
+
+# Function to run every query of the input file and stream the results to the output file, chunk by chunk
+def run_batch(input_path, output_path, mode="Filters", all_results=False, chunk_size=CHUNK_SIZE, csv_path=CSV_FILE_PATH):
+    catalog = get_catalog(csv_path)
+    term_cache = TermCache(catalog.search_index)
+    output = sys.stdout if output_path == "-" else open(output_path, "w", newline="", encoding="utf-8")
+    writer = CsvWriter(output) if output_path.lower().endswith(".csv") else JsonlWriter(output)
+    searched = failed = 0
+    started = time.perf_counter()
+    try:
+        for queries in chunked(read_queries(input_path, mode), chunk_size):
+            for result in search_chunk(catalog, queries, term_cache, all_results):
+                writer.write(result)
+                failed += "error" in result
+            output.flush()
+            searched += len(queries)
+            print(f"Searched {searched} queries in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return searched, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a file of text queries through the image search.")
+    parser.add_argument("input", help="JSONL or CSV file of queries, or - for JSONL on stdin")
+    parser.add_argument("output", help="output .jsonl or .csv file, or - for JSONL on stdout")
+    parser.add_argument("--mode", default="Filters", choices=SEARCH_MODES, help="search mode of queries that do not set one")
+    parser.add_argument("--all", action="store_true", help="write every match instead of the number of images the query asks for")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--catalog", default=CSV_FILE_PATH, help="catalog CSV")
+    args = parser.parse_args()
+    if args.input != "-" and not os.path.exists(args.input):
+        parser.error(f"{args.input} does not exist")
+    searched, failed = run_batch(args.input, args.output, args.mode, args.all, args.chunk_size, args.catalog)
+    print(f"Done: {searched} queries, {failed} failed", file=sys.stderr)
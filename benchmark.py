@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from PIL import Image
+import images
+import query_parser
+from catalog import CSV_FILE_PATH, get_catalog
+from caption_index import parse_captions
+from query_parser import ACTIONS, normalize_query
+from records import get_drive_file_id
+from result_cache import get_result_cache
+from search import (AVAILABLE_PLAYERS, FILTER_ACTIONS, FILTER_ACTIVITIES, filter_images,
+                    filter_images_by_players_and_action, parse_search_query, search_images)
+from search_pipeline import run_text_search
+
+# Benchmarks of the search, filtering and rendering hot paths on synthetic catalogs:
+#   python benchmark.py --sizes 10000 100000 1000000 --queries 200 --gemini-latency 0.3 --drive-latency 0.1
+# Gemini and Google Drive are replaced by local stubs with a fixed latency, so runs are repeatable offline.
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_QUERIES = 200
+# Queries run under tracemalloc to measure the memory each hot path allocates
+MEMORY_SAMPLES = 20
+# Pages of thumbnails rendered by the image benchmark, six images per page like the app
+IMAGE_PAGES = 10
+PAGE_SIZE = 6
+# Text queries submitted end to end, with cold caches, by the Submit benchmark
+SUBMIT_QUERIES = 20
+# Players per image, drawn with these weights; most photos show one player, team photos show many
+PLAYERS_PER_IMAGE = [1, 2, 3, 4, 5, 8, 12, 18]
+PLAYERS_PER_IMAGE_WEIGHTS = [0.55, 0.15, 0.1, 0.08, 0.05, 0.04, 0.02, 0.01]
+MAKES = ["Google", "Fujifilm", "Sony"]
+LOCATIONS = ["Chennai", "Mumbai", "Delhi"]
+ENVIRONMENTS = ["outdoor", "indoor", "Unknown"]
+FALLBACK_CAPTIONS = ["a man is holding a bat while wearing a helmet", "some men walking to their hotel with luggage",
+                     "a cricket player in a yellow jersey bowling a ball", "players posing for a team photo",
+                     "a man speaking into a microphone at an event", "fans cheering in the stadium at night"]
+# Words added to a query so that the local parser cannot resolve it and it goes to Gemini
+UNKNOWN_PHRASES = ["near the team bus", "after the match", "with the trophy", "in the dressing room"]
+
+
+# Function to get real captions to sample from, so caption search sees realistic text
+def caption_pool(path=CSV_FILE_PATH):
+    if not os.path.exists(path):
+        return FALLBACK_CAPTIONS
+    captions = set()
+    for value in pd.read_csv(path, usecols=["Captions"])["Captions"]:
+        captions.update(parse_captions(value))
+    return sorted(captions) or FALLBACK_CAPTIONS
+
+
+# Function to generate a catalog with the repo1.csv schema and about the given number of rows
+def make_synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    captions = np.array(caption_pool())
+    mean_players = np.average(PLAYERS_PER_IMAGE, weights=PLAYERS_PER_IMAGE_WEIGHTS)
+    num_images = max(1, int(rows / mean_players))
+    counts = rng.choice(PLAYERS_PER_IMAGE, size=num_images, p=PLAYERS_PER_IMAGE_WEIGHTS)
+    image_of_row = np.repeat(np.arange(num_images), counts)
+    # Players of an image are distinct: a random rotation of the roster per image
+    offsets = np.arange(len(image_of_row)) - np.repeat(np.cumsum(counts) - counts, counts)
+    start = rng.integers(0, len(AVAILABLE_PLAYERS), size=num_images)
+    players = np.array(AVAILABLE_PLAYERS)[(np.repeat(start, counts) + offsets) % len(AVAILABLE_PLAYERS)]
+    days = [date(2023, 5, 1) + timedelta(days=int(d)) for d in range(90)]
+    # The CSV mixes "21/05/2023", "8/5/2023" and "28-07-2023"
+    date_texts = np.array([[d.strftime("%d/%m/%Y"), f"{d.day}/{d.month}/{d.year}", d.strftime("%d-%m-%Y")][i % 3]
+                           for i, d in enumerate(days)])
+    caption_choices = rng.integers(0, len(captions), size=(num_images, 3))
+    image_captions = np.array([str(list(captions[choice])) for choice in caption_choices])
+
+    def per_image(values):
+        return np.asarray(values)[rng.integers(0, len(values), size=num_images)][image_of_row]
+
+    df = pd.DataFrame({
+        "ID": np.char.add(np.char.add("SYN-", np.char.zfill(np.arange(num_images).astype(str), 7)), ".jpg")[image_of_row],
+        "URL": np.char.add(np.char.add("https://drive.google.com/file/d/SYN", np.char.zfill(np.arange(num_images).astype(str), 9)),
+                           "/view?usp=drivesdk")[image_of_row],
+        "Name": players,
+        "Make": per_image(MAKES),
+        "Day/Night": per_image(["day", "night"]),
+        "Environment": per_image(ENVIRONMENTS),
+        "ShotType": per_image(["close", "far"]),
+        "Date": per_image(date_texts),
+        "No_of_faces": np.repeat(counts, counts),
+        "Captions": image_captions[image_of_row],
+        "Action": rng.choice(ACTIONS, size=len(image_of_row)),
+        "Location": per_image(LOCATIONS),
+    })
+    return df
+
+
+# Function to draw queries from a pool with Zipf-like weights, so popular queries repeat as they would in use
+def zipf_sample(rng, pool, count):
+    weights = 1 / np.arange(1, len(pool) + 1)
+    return [pool[i] for i in rng.choice(len(pool), size=count, p=weights / weights.sum())]
+
+
+# Function to build the text-search query mix: mostly locally parseable queries, some that need Gemini
+def make_text_queries(rng, count):
+    pool = []
+    for _ in range(max(count, 50)):
+        player, other = rng.sample(AVAILABLE_PLAYERS, 2)
+        action = rng.choice(ACTIONS)
+        pool.append(rng.choice([
+            f"{player}",
+            f"{player} {action}",
+            f"{player} and {other}",
+            f"{player} {action} at night",
+            f"{action} in {rng.choice(LOCATIONS)}",
+            f"5 images of {player} {action}",
+            f"{player} {rng.choice(UNKNOWN_PHRASES)}",
+            f"{player} {action} {rng.choice(UNKNOWN_PHRASES)}",
+        ]))
+    return zipf_sample(np.random.default_rng(rng.getrandbits(32)), pool, count)
+
+
+# Function to build the filter-tab query mix from the tab's own players, actions and activities
+def make_filter_queries(rng, count):
+    queries = []
+    for _ in range(count):
+        from_date = date(2023, 5, 1) + timedelta(days=rng.randrange(60)) if rng.random() < 0.3 else None
+        queries.append({
+            "players": rng.sample(AVAILABLE_PLAYERS, rng.choice([1, 1, 1, 2, 2, 3])),
+            "action": rng.choice(FILTER_ACTIONS) if rng.random() < 0.5 else None,
+            "activity": rng.choice(FILTER_ACTIVITIES) if rng.random() < 0.3 else None,
+            "from_date": from_date,
+            "to_date": from_date + timedelta(days=rng.randrange(1, 30)) if from_date else None,
+            "no_of_faces": rng.choice([0, 0, 0, 1, 2]),
+        })
+    return queries
+
+
+# Function to build caption-search queries from caption text
+def make_caption_queries(rng, count):
+    captions = caption_pool()
+    queries = []
+    for _ in range(count):
+        words = rng.choice(captions).split()
+        queries.append(" ".join(rng.sample(words, min(len(words), rng.randint(2, 4)))))
+    return queries
+
+
+# Gemini stand-in: waits like a model call, then answers with the fields the local parser can find
+def make_gemini_stub(catalog, latency):
+    def parse_query_with_stub(user_query):
+        time.sleep(latency)
+        extracted = catalog.query_parser.extract(normalize_query(user_query))
+        return "```json\n" + json.dumps(extracted[0] if extracted else {"Players": []}) + "\n```"
+    return parse_query_with_stub
+
+
+# Function to make the JPEG every stubbed Drive download returns, sized like a camera photo
+def make_stub_image(width=4000, height=3000):
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((width, height)).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+# Google Drive stand-in: a local HTTP server that answers every download after a fixed latency
+def start_drive_stub(latency):
+    content = make_stub_image()
+
+    class DriveStubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DriveStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Resident memory of the process in MB
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Function to summarize latencies in milliseconds
+def summarize(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+# Function to time run(query) for every query, and measure the peak memory of a sample of them
+def measure(run, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        run(query)
+        latencies.append(time.perf_counter() - started)
+    stats = summarize(latencies)
+    peak = 0
+    tracemalloc.start()
+    for query in queries[:MEMORY_SAMPLES]:
+        tracemalloc.reset_peak()
+        run(query)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    stats["peak_alloc_mb"] = peak / 2 ** 20
+    return stats
+
+
+# Function to load a catalog and build every index, timing each step
+def bench_load(path):
+    results = {}
+    rss_before = rss_mb()
+    for name, step in [
+        ("load", lambda: get_catalog(path)),
+        ("search_index", lambda: get_catalog(path).search_index),
+        ("records", lambda: get_catalog(path).records),
+        ("player_index", lambda: get_catalog(path).player_index),
+        ("url_player_index", lambda: get_catalog(path).url_player_index),
+        ("caption_index", lambda: get_catalog(path).caption_index),
+        ("query_parser", lambda: get_catalog(path).query_parser),
+    ]:
+        started = time.perf_counter()
+        step()
+        results[f"{name}_s"] = time.perf_counter() - started
+    results["rss_mb"] = rss_mb() - rss_before
+    return results
+
+
+# Function to render pages of results through the thumbnail pipeline, cold and then from the disk cache
+def bench_images(catalog, rng):
+    urls = list(catalog.records.by_url)
+    pages = [[get_drive_file_id(url) for url in rng.sample(urls, PAGE_SIZE)] for _ in range(IMAGE_PAGES)]
+
+    def render(page):
+        for _, thumbnail in images.fetch_thumbnails(page):
+            Image.open(io.BytesIO(thumbnail)).load()
+
+    return {"cold": measure(render, pages), "warm": measure(render, pages)}
+
+
+# Function to time Submit end to end on cold caches: parse, search and the first page of thumbnails, run
+# one stage after another and through search_pipeline.py. The Gemini stub answers with the local parser's
+# fields, so the pipeline's guess is always right and this shows its best case.
+def bench_submit(catalog, queries, work_dir):
+    def render(urls):
+        page = [get_drive_file_id(url) for url in urls[:PAGE_SIZE]]
+        for _, thumbnail in images.fetch_thumbnails(page):
+            Image.open(io.BytesIO(thumbnail)).load()
+
+    def sequential(query):
+        parsed_query = parse_search_query(catalog, query)
+        render(search_images(catalog, query, parsed_query) if parsed_query is not None else [])
+
+    def pipelined(query):
+        render(asyncio.run(run_text_search(catalog, query, page_size=PAGE_SIZE)) or [])
+
+    results = {}
+    for name, run in [("sequential", sequential), ("pipelined", pipelined)]:
+        query_parser.QUERY_CACHE_PATH = os.path.join(work_dir, f"query_cache_submit_{name}.sqlite3")
+        query_parser._query_cache = None
+        images.THUMBNAIL_CACHE_DIR = os.path.join(work_dir, f"thumbnails_submit_{name}")
+        images._thumbnail_cache = None
+        get_result_cache().clear()
+        results[name] = measure(run, queries)
+    return results
+
+
+def run_size(rows, args, work_dir, drive_server):
+    rng = random.Random(args.seed)
+    path = os.path.join(work_dir, f"synthetic_{rows}.csv")
+    started = time.perf_counter()
+    df = make_synthetic_frame(rows, args.seed)
+    df.to_csv(path, index=False)
+    print(f"Generated {len(df)} rows ({df['URL'].nunique()} images) in {time.perf_counter() - started:.1f}s")
+
+    # Start every size with empty query and thumbnail caches
+    query_parser.QUERY_CACHE_PATH = os.path.join(work_dir, f"query_cache_{rows}.sqlite3")
+    query_parser._query_cache = None
+    images.THUMBNAIL_CACHE_DIR = os.path.join(work_dir, f"thumbnails_{rows}")
+    images._thumbnail_cache = None
+
+    results = {"rows": len(df), "load": bench_load(path)}
+    catalog = get_catalog(path)
+    query_parser.parse_query_with_gemini = make_gemini_stub(catalog, args.gemini_latency)
+    text_queries = make_text_queries(rng, args.queries)
+    parsed_queries = [parse_search_query(catalog, query) for query in text_queries]
+
+    def text_filter(parsed):
+        return filter_images_by_players_and_action(
+            catalog, parsed.get("Players", []), parsed.get("Action"), parsed.get("Environment"),
+            parsed.get("Day/Night"), parsed.get("ShotType"), parsed.get("Date"), parsed.get("Location"))
+
+    filter_queries = make_filter_queries(rng, args.queries)
+    # The query mixes repeat queries, and measure() runs some of them twice, so the result cache would turn
+    # most of these stages into cache hits; it is kept off here and timed in stages of its own below
+    result_cache = get_result_cache()
+    result_cache_size = result_cache.max_entries
+    result_cache.max_entries = 0
+    result_cache.clear()
+    results["text_filter"] = measure(text_filter, parsed_queries)
+    # The parses above already filled the query cache; run the end-to-end mix again from a cold cache
+    query_parser.QUERY_CACHE_PATH = os.path.join(work_dir, f"query_cache_{rows}_e2e.sqlite3")
+    query_parser._query_cache = None
+    results["text_search"] = measure(
+        lambda query: search_images(catalog, query, parse_search_query(catalog, query)), text_queries)
+    results["caption_search"] = measure(
+        lambda query: search_images(catalog, query, parse_search_query(catalog, query, "Captions"), "Captions"),
+        make_caption_queries(rng, args.queries))
+    results["filter_tab"] = measure(lambda query: filter_images(catalog, **query), filter_queries)
+    if drive_server is not None:
+        results["thumbnails"] = bench_images(catalog, rng)
+        results["submit"] = bench_submit(catalog, text_queries[:SUBMIT_QUERIES], work_dir)
+    result_cache.max_entries = result_cache_size
+    if not args.no_result_cache:
+        # Repeated searches served from the result cache, after one pass to fill it
+        for parsed in parsed_queries:
+            text_filter(parsed)
+        for query in filter_queries:
+            filter_images(catalog, **query)
+        results["text_filter_cached"] = measure(text_filter, parsed_queries)
+        results["filter_tab_cached"] = measure(lambda query: filter_images(catalog, **query), filter_queries)
+    return results
+
+
+def print_results(results):
+    print(f"\n== {results['rows']} rows ==")
+    load = results["load"]
+    print("load: " + ", ".join(f"{name} {value:.2f}" for name, value in load.items()))
+    stages = [(name, results[name]) for name in ["text_filter", "text_search", "caption_search", "filter_tab",
+                                                 "text_filter_cached", "filter_tab_cached"] if name in results]
+    if "thumbnails" in results:
+        stages += [(f"thumbnails_{name}", stats) for name, stats in results["thumbnails"].items()]
+        stages += [(f"submit_{name}", stats) for name, stats in results["submit"].items()]
+    print(f"{'stage':<18}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'peak MB':>10}")
+    for name, stats in stages:
+        print(f"{name:<18}{stats['count']:>7}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['peak_alloc_mb']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark search, filtering and thumbnail rendering on synthetic catalogs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="catalog sizes in rows")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="queries per benchmark")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="seconds the Gemini stub takes per call")
+    parser.add_argument("--drive-latency", type=float, default=0.1, help="seconds the Drive stub takes per download")
+    parser.add_argument("--skip-images", action="store_true", help="do not benchmark thumbnail downloads")
+    parser.add_argument("--no-result-cache", action="store_true", help="skip the stages that time searches served from the result cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    drive_server = None
+    if not args.skip_images:
+        drive_server = start_drive_stub(args.drive_latency)
+        images.drive_direct_link = lambda file_id: f"http://127.0.0.1:{drive_server.server_port}/uc?id={file_id}"
+    all_results = []
+    with tempfile.TemporaryDirectory(prefix="imagesearch-bench-") as work_dir:
+        for rows in args.sizes:
+            results = run_size(rows, args, work_dir, drive_server)
+            print_results(results)
+            all_results.append(results)
+    if drive_server is not None:
+        drive_server.shutdown()
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(all_results, output, indent=2)
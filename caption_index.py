@@ -0,0 +1,136 @@
+import ast
+import os
+import re
+import sys
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Words too common in captions to help ranking
+STOP_WORDS = {"a", "an", "the", "of", "and", "or", "in", "on", "at", "to", "with", "his", "her", "their", "is",
+              "are", "while", "for", "by", "from", "near", "some", "two", "three", "it", "its", "as", "into"}
+
+
+# Function to split text into lowercase caption terms
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOP_WORDS]
+
+
+# Function to read the stringified caption list stored in the Captions column
+def parse_captions(value):
+    if not isinstance(value, str):
+        return []
+    try:
+        captions = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return [value]
+    return [str(caption) for caption in captions] if isinstance(captions, (list, tuple)) else [str(captions)]
+
+
+# Path of the caption index saved next to the catalog CSV
+def caption_index_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".captions.npz"
+
+
+class CaptionIndex:
+    """BM25 inverted index over image captions, stored as CSR arrays of precomputed term weights."""
+
+    def __init__(self, vocabulary, indptr, doc_ids, weights, size):
+        self.vocabulary = vocabulary
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.size = size
+
+    # Build the index with one document per image: all distinct captions of its rows, in the order of ids
+    @classmethod
+    def build(cls, df, ids):
+        positions = pd.Index(ids).get_indexer(df["ID"])
+        documents = [[] for _ in range(len(ids))]
+        seen = [set() for _ in range(len(ids))]
+        for position, value in zip(positions, df["Captions"]):
+            for caption in parse_captions(value):
+                if caption not in seen[position]:
+                    seen[position].add(caption)
+                    documents[position].extend(tokenize(caption))
+        lengths = np.array([len(document) for document in documents], dtype=np.float64)
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        postings = {}
+        for doc_id, document in enumerate(documents):
+            for term, count in Counter(document).items():
+                postings.setdefault(term, []).append((doc_id, count))
+        vocabulary = sorted(postings)
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        doc_ids = []
+        weights = []
+        for i, term in enumerate(vocabulary):
+            term_postings = postings[term]
+            idf = np.log(1 + (len(ids) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_id, count in term_postings:
+                norm = K1 * (1 - B + B * lengths[doc_id] / average_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * count * (K1 + 1) / (count + norm))
+            indptr[i + 1] = len(doc_ids)
+        return cls(np.array(vocabulary, dtype=str), indptr, np.array(doc_ids, dtype=np.int32),
+                   np.array(weights, dtype=np.float32), len(ids))
+
+    def save(self, path, source_mtime):
+        # Write to a temporary file first so other workers never read a half-written index
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temp_path, vocabulary=self.vocabulary, indptr=self.indptr, doc_ids=self.doc_ids,
+                 weights=self.weights, size=np.array(self.size), source_mtime=np.array(source_mtime))
+        os.replace(temp_path, path)
+
+    # Function to load a saved index, or None when it is missing or was built from another version of the CSV
+    @classmethod
+    def load(cls, path, source_mtime, size):
+        try:
+            with np.load(path) as data:
+                if float(data["source_mtime"]) != source_mtime or int(data["size"]) != size:
+                    return None
+                return cls(data["vocabulary"], data["indptr"], data["doc_ids"], data["weights"], size)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    # BM25 score of every image for the query text
+    def scores(self, text):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(text)):
+            term_id = self.term_ids.get(term)
+            if term_id is not None:
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    # Positions of the images matching the query, best first, optionally restricted to a bitmap
+    def rank(self, text, mask=None):
+        scores = self.scores(text)
+        if mask is not None:
+            scores[~mask] = 0
+        hits = np.flatnonzero(scores > 0)
+        # Stable sort keeps ties in catalog order
+        return hits[np.argsort(-scores[hits], kind="stable")]
+
+
+# Function to load the caption index saved next to the CSV, building and saving it when it is stale
+def load_caption_index(csv_path, source_mtime, df, ids):
+    path = caption_index_path(csv_path)
+    index = CaptionIndex.load(path, source_mtime, len(ids))
+    if index is None:
+        index = CaptionIndex.build(df, ids)
+        try:
+            index.save(path, source_mtime)
+        except OSError as e:
+            print(f"Error saving caption index: {e}")
+    return index
+
+
+# Build the caption index ahead of time: python caption_index.py [repo1.csv]
+if __name__ == "__main__":
+    from catalog import CSV_FILE_PATH, get_catalog
+    catalog = get_catalog(sys.argv[1] if len(sys.argv) > 1 else CSV_FILE_PATH)
+    print(f"Caption index with {len(catalog.caption_index.vocabulary)} terms saved to {caption_index_path(catalog.path)}")
@@ -0,0 +1,168 @@
+import os
+import threading
+from functools import cached_property
+import pandas as pd
+from search_index import SearchIndex
+from caption_index import load_caption_index
+from semantic_index import SemanticIndex, semantic_index_paths
+from query_parser import LocalQueryParser
+from records import RecordStore
+from facets import FacetIndex
+from player_index import PlayerIndex
+from catalog_store import read_ingest_frame, read_store_frame, store_exists, store_path
+from metrics import increment, timed
+
+# Path to the CSV file
+CSV_FILE_PATH = "repo1.csv"
+# Columns with a small set of repeated values, stored as pandas categoricals
+CATEGORICAL_COLUMNS = ["Name", "Make", "Day/Night", "Environment", "ShotType", "Action", "Location"]
+
+
+# Parse the mixed "21/05/2023", "8/5/2023" and "28-07-2023" formats in the Date column
+def parse_dates(values):
+    return pd.to_datetime(values, format="mixed", dayfirst=True, errors="coerce")
+
+
+# Convert the columns of a raw catalog frame, as read from the CSV or built by ingest.py, to their proper types
+def prepare_catalog_frame(df):
+    if "Date" in df.columns:
+        # Keep the original text for the text search tab, which matches dates as substrings
+        df["DateText"] = df["Date"].astype(str)
+        df["Date"] = parse_dates(df["Date"])
+    if "No_of_faces" in df.columns:
+        df["No_of_faces"] = pd.to_numeric(df["No_of_faces"], errors="coerce").fillna(0).astype("int32")
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+# Read the CSV file and convert its columns to their proper types once
+def read_catalog_frame(path):
+    return prepare_catalog_frame(pd.read_csv(path))
+
+
+# Read the CSV together with the rows ingest.py added to its columnar store, which the CSV does not hold
+def read_catalog_frame_with_ingested(path):
+    df = read_catalog_frame(path)
+    columnar_path = store_path(path)
+    ingested = read_ingest_frame(columnar_path) if store_exists(columnar_path) else None
+    if ingested is None:
+        return df
+    df = pd.concat([df, ingested], ignore_index=True)
+    # Categoricals with different categories concatenate to plain objects
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+# Function to find what to load for a catalog CSV: its columnar store (see catalog_store.py)
+# when that is at least as new as the CSV, otherwise the CSV, read with the store's ingested rows
+# until the next ingestion brings the store in line with it. Returns the path and its mtime.
+def resolve_catalog_source(path):
+    csv_mtime = os.path.getmtime(path)
+    columnar_path = store_path(path)
+    if store_exists(columnar_path):
+        store_mtime = os.path.getmtime(columnar_path)
+        if store_mtime >= csv_mtime:
+            return columnar_path, store_mtime
+    return path, csv_mtime
+
+
+class Catalog:
+    """In-memory copy of the image catalog, shared by every session in the process."""
+
+    def __init__(self, path, mtime, df, source=None):
+        self.path = path
+        self.mtime = mtime
+        self.df = df
+        # The file or columnar store the frame was read from
+        self.source = source or path
+        # (mtime of the semantic index file, index) as last loaded; see semantic_index
+        self._semantic_index = None
+        self._semantic_index_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return (self.path, self.mtime)
+
+    # Built on first use and kept for as long as this version of the catalog
+    @cached_property
+    def search_index(self):
+        with timed("build_search_index"):
+            return SearchIndex(self.df)
+
+    # Per-image records for constant-time lookups by URL or ID
+    @cached_property
+    def records(self):
+        with timed("build_records"):
+            return RecordStore(self.df)
+
+    # BM25 index over the captions, aligned with the search index's image IDs and saved next to the CSV
+    @cached_property
+    def caption_index(self):
+        with timed("load_caption_index"):
+            return load_caption_index(self.path, self.mtime, self.df, self.search_index.ids)
+
+    # Memory-mapped caption embeddings, or None until python semantic_index.py has been run for this version.
+    # Loaded again whenever the index file changes, so an index built while the app runs is picked up.
+    @property
+    def semantic_index(self):
+        meta_path = semantic_index_paths(self.path)[1]
+        meta_mtime = os.path.getmtime(meta_path) if os.path.exists(meta_path) else None
+        entry = self._semantic_index
+        if entry is None or entry[0] != meta_mtime:
+            with self._semantic_index_lock:
+                entry = self._semantic_index
+                if entry is None or entry[0] != meta_mtime:
+                    entry = (meta_mtime, SemanticIndex.load(self.path, self.mtime, self.search_index.size))
+                    self._semantic_index = entry
+        return entry[1]
+
+    # Player posting lists and co-occurrence counts over the search index's image IDs
+    @cached_property
+    def player_index(self):
+        with timed("build_player_index"):
+            return PlayerIndex.from_frame(self.df, "ID")
+
+    # The same over URLs, for the filter tab, which treats every URL as its own image
+    @cached_property
+    def url_player_index(self):
+        with timed("build_player_index", key="URL"):
+            return PlayerIndex.from_frame(self.df, "URL")
+
+    # Row postings for the filter tab's live counts per option
+    @cached_property
+    def facet_index(self):
+        with timed("build_facet_index"):
+            return FacetIndex(self.df)
+
+    # Parser for simple queries, using the players and locations present in this catalog
+    @cached_property
+    def query_parser(self):
+        postings = self.search_index.postings
+        return LocalQueryParser(postings.get("Name", {}).keys(), postings.get("Location", {}).keys())
+
+
+# Loaded catalogs, keyed by CSV path
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+# Function to get the catalog, reloading it only when the CSV file's (or its columnar store's) mtime changes
+def get_catalog(path=CSV_FILE_PATH):
+    source, mtime = resolve_catalog_source(path)
+    catalog = _catalogs.get(path)
+    if catalog is not None and catalog.mtime == mtime and catalog.source == source:
+        increment("cache_requests_total", cache="catalog", result="hit")
+        return catalog
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None or catalog.mtime != mtime or catalog.source != source:
+            increment("cache_requests_total", cache="catalog", result="miss")
+            with timed("catalog_load", format="arrow" if source != path else "csv"):
+                df = read_store_frame(source) if source != path else read_catalog_frame_with_ingested(path)
+            catalog = Catalog(path, mtime, df, source)
+            _catalogs[path] = catalog
+    return catalog
@@ -0,0 +1,159 @@
+import argparse
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Columnar copy of the catalog: a directory of Arrow IPC segments next to the CSV.
+# Each ingestion appends one segment holding only the rows that were not stored yet;
+# rows edited or deleted in the CSV make it rewrite the CSV rows instead.
+SEGMENT_SUFFIX = ".arrow"
+# Segments of rows read from the CSV, and of rows added by ingest.py, which the CSV does not hold.
+# Segments named before this split hold CSV rows.
+CSV_SEGMENT_PREFIX = "csv-"
+INGEST_SEGMENT_PREFIX = "ingest-"
+# Rows are identified by image, file and player, so a new player tagged on an old image is a new row
+ROW_KEY_COLUMNS = ["ID", "URL", "Name"]
+
+
+# Path of the columnar store that belongs to a catalog CSV
+def store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".store"
+
+
+def segment_paths(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+
+def is_ingest_segment(segment_path):
+    return os.path.basename(segment_path).startswith(INGEST_SEGMENT_PREFIX)
+
+
+# Function to check whether a store exists and holds at least one segment
+def store_exists(path):
+    return os.path.isdir(path) and bool(segment_paths(path))
+
+
+# Function to convert a typed catalog frame to an Arrow table sorted by ID
+def frame_to_table(df):
+    df = df.sort_values("ID", kind="stable").reset_index(drop=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if "Date" in table.column_names:
+        # Store plain ISO dates rather than timestamps
+        position = table.column_names.index("Date")
+        table = table.set_column(position, "Date", table.column("Date").cast(pa.date32()))
+    return table
+
+
+# Function to read every segment of a store through memory maps and return the catalog frame
+def read_store_frame(path):
+    return read_segments(segment_paths(path))
+
+
+# Function to read the given segments through memory maps into one frame
+def read_segments(paths):
+    tables = []
+    for segment_path in paths:
+        with pa.memory_map(segment_path, "r") as source:
+            tables.append(pa.ipc.open_file(source).read_all())
+    table = pa.concat_tables(tables, promote_options="permissive") if len(tables) > 1 else tables[0]
+    df = table.to_pandas(date_as_object=False)
+    if "Date" in df.columns:
+        df["Date"] = df["Date"].astype("datetime64[ns]")
+    return df
+
+
+# Function to read the rows added by ingest.py, which the CSV does not hold, or None when there are none
+def read_ingest_frame(path):
+    paths = [segment_path for segment_path in segment_paths(path) if is_ingest_segment(segment_path)]
+    return read_segments(paths) if paths else None
+
+
+# Function to write one segment, atomically, so readers never see a partial file
+def write_segment(path, table, prefix):
+    os.makedirs(path, exist_ok=True)
+    name = f"{prefix}{time.strftime('%Y%m%d%H%M%S')}-{time.time_ns() % 1_000_000_000:09d}{SEGMENT_SUFFIX}"
+    temp_path = os.path.join(path, f".{name}.tmp")
+    with pa.OSFile(temp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, os.path.join(path, name))
+    return os.path.join(path, name)
+
+
+# Function to append ingested rows that the store does not hold yet; returns the number of rows added
+def append_new_rows(path, df):
+    if store_exists(path):
+        stored = read_store_frame(path)[ROW_KEY_COLUMNS].astype(str)
+        stored_keys = pd.MultiIndex.from_frame(stored)
+        keys = pd.MultiIndex.from_frame(df[ROW_KEY_COLUMNS].astype(str))
+        df = df[~keys.isin(stored_keys)]
+    if df.empty:
+        return 0
+    write_segment(path, frame_to_table(df), INGEST_SEGMENT_PREFIX)
+    return len(df)
+
+
+# Function to rewrite the CSV rows of the store as a single ID-sorted segment, keeping the ingested segments
+def rebuild_store(path, df):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    write_segment(temp_path, frame_to_table(df), CSV_SEGMENT_PREFIX)
+    if os.path.isdir(path):
+        for segment_path in segment_paths(path):
+            if is_ingest_segment(segment_path):
+                shutil.copy2(segment_path, temp_path)
+        shutil.rmtree(path)
+    os.replace(temp_path, path)
+    return len(df)
+
+
+# Hash of every row over the given columns, equal for rows with equal values. Missing values read from the
+# CSV (NaN) and from Arrow (None) are both hashed as empty text, so an empty cell still matches its stored copy.
+def row_hashes(df, columns):
+    values = df.reindex(columns=columns).astype(object)
+    values = values.where(values.notna(), "")
+    return pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy()
+
+
+# Function to bring the store's CSV rows in line with the typed CSV frame df. When the CSV only gained rows,
+# they are appended as a new segment; when a stored row was edited or deleted, the CSV rows are rewritten.
+# Returns "created", "appended" or "rebuilt" and the number of rows written.
+def sync_csv_rows(path, df):
+    csv_segments = [segment_path for segment_path in segment_paths(path) if not is_ingest_segment(segment_path)] \
+        if os.path.isdir(path) else []
+    if not csv_segments:
+        return "created", rebuild_store(path, df)
+    stored_hashes = row_hashes(read_segments(csv_segments), df.columns)
+    hashes = row_hashes(df, df.columns)
+    if not np.isin(stored_hashes, hashes).all():
+        return "rebuilt", rebuild_store(path, df)
+    new_rows = df[~np.isin(hashes, stored_hashes)]
+    if new_rows.empty:
+        # Nothing to write, but mark the store as up to date with the CSV so the catalog keeps loading it
+        os.utime(path)
+        return "appended", 0
+    write_segment(path, frame_to_table(new_rows), CSV_SEGMENT_PREFIX)
+    return "appended", len(new_rows)
+
+
+# Ingest the CSV into its columnar store: python catalog_store.py [repo1.csv] [--rebuild]
+if __name__ == "__main__":
+    from catalog import CSV_FILE_PATH, read_catalog_frame
+    parser = argparse.ArgumentParser(description="Convert the catalog CSV into memory-mappable Arrow segments.")
+    parser.add_argument("csv_path", nargs="?", default=CSV_FILE_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="rewrite the CSV rows of the store even when only rows were added")
+    args = parser.parse_args()
+    path = store_path(args.csv_path)
+    df = read_catalog_frame(args.csv_path)
+    if args.rebuild:
+        print(f"Wrote {rebuild_store(path, df)} rows to {path}")
+    else:
+        action, rows = sync_csv_rows(path, df)
+        if action == "created":
+            print(f"Wrote {rows} rows to {path}")
+        elif action == "rebuilt":
+            print(f"Rows were edited or deleted in the CSV; rewrote {rows} rows to {path}")
+        else:
+            print(f"Appended {rows} new rows to {path}")
@@ -0,0 +1,16 @@
+import os
+import pytest
+from catalog import get_catalog
+
+# The sample catalog the tests search, found from the repo root whatever the working directory
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "repo1.csv")
+
+
+@pytest.fixture(scope="session")
+def csv_path():
+    return CSV_PATH
+
+
+@pytest.fixture(scope="session")
+def catalog():
+    return get_catalog(CSV_PATH)
@@ -0,0 +1,159 @@
+import csv
+import os
+import sys
+import threading
+from image_hash import format_hash, hamming_distance, parse_hash, perceptual_hash
+from metrics import increment, timed
+
+# Near-duplicate collapsing: images whose perceptual hashes (see image_hash.py) differ in at most
+# NEAR_DUPLICATE_DISTANCE bits are grouped, and a result list keeps only the first image of each group.
+# Hashes come from the catalog's PHash column (written by ingest.py), else from the hashes file next to
+# the CSV (written by python duplicates.py from the thumbnail cache).
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "8"))
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes, finding all hashes within a Hamming distance without a full scan."""
+
+    def __init__(self):
+        # Each node is [hash, {distance to child: child node}]
+        self.root = None
+
+    def add(self, value):
+        if self.root is None:
+            self.root = [value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                return
+            node = child
+
+    # Hashes within max_distance of value. By the triangle inequality only children whose edge distance
+    # lies within max_distance of the node's own distance can hold matches.
+    def search(self, value, max_distance):
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_value, children = nodes.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.append(node_value)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    nodes.append(child)
+        return matches
+
+
+class DuplicateIndex:
+    """Group of every hashed image URL, where near-duplicate images share a group."""
+
+    def __init__(self, hashes, max_distance=NEAR_DUPLICATE_DISTANCE):
+        # hashes maps URL -> 64-bit hash
+        self.max_distance = max_distance
+        # Leader clustering: each hash joins the nearest group leader within max_distance, or leads a new
+        # group. Every image is compared with its leader rather than with any member, so a chain of frames
+        # that drifts a few bits at a time cannot pull clearly different images into one group.
+        leaders = BKTree()
+        leader_of = {}
+        for value in dict.fromkeys(hashes.values()):
+            matches = leaders.search(value, max_distance)
+            if matches:
+                leader_of[value] = min(matches, key=lambda leader: (hamming_distance(value, leader), leader))
+            else:
+                leaders.add(value)
+                leader_of[value] = value
+        self.groups = {url: leader_of[value] for url, value in hashes.items()}
+
+    def __len__(self):
+        return len(self.groups)
+
+    # Function to keep the first URL of every group, in the given order; URLs without a hash are all kept
+    def collapse(self, urls):
+        seen = set()
+        collapsed = []
+        for url in urls:
+            group = self.groups.get(url)
+            if group is not None:
+                if group in seen:
+                    continue
+                seen.add(group)
+            collapsed.append(url)
+        return collapsed
+
+
+# Path of the URL -> perceptual hash table kept next to a catalog CSV
+def hashes_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".hashes.csv"
+
+
+# Function to read the hashes file, or an empty table when it has not been built
+def read_hashes(csv_path):
+    hashes = {}
+    path = hashes_path(csv_path)
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as source:
+            for row in csv.DictReader(source):
+                hashes[row["URL"]] = parse_hash(row["PHash"])
+    return hashes
+
+
+# Function to gather the hash of every catalog image, preferring the catalog's own PHash column
+def catalog_hashes(catalog):
+    hashes = read_hashes(catalog.path)
+    if "PHash" in catalog.df.columns:
+        for url, value in catalog.df[["URL", "PHash"]].dropna().itertuples(index=False):
+            hashes[url] = parse_hash(value)
+    return hashes
+
+
+_duplicate_indexes = {}
+_duplicate_indexes_lock = threading.Lock()
+
+
+# Function to get the duplicate groups of a catalog, rebuilt when the catalog or its hashes file changes
+def get_duplicate_index(catalog):
+    path = hashes_path(catalog.path)
+    version = (catalog.version, os.path.getmtime(path) if os.path.exists(path) else None)
+    entry = _duplicate_indexes.get(catalog.path)
+    if entry is None or entry[0] != version:
+        with _duplicate_indexes_lock:
+            entry = _duplicate_indexes.get(catalog.path)
+            if entry is None or entry[0] != version:
+                with timed("build_duplicate_index"):
+                    entry = (version, DuplicateIndex(catalog_hashes(catalog)))
+                _duplicate_indexes[catalog.path] = entry
+    return entry[1]
+
+
+# Function to drop the near-duplicates of earlier results from a result list
+def collapse_near_duplicates(catalog, urls):
+    with timed("collapse_duplicates"):
+        collapsed = get_duplicate_index(catalog).collapse(urls)
+    increment("near_duplicates_hidden_total", len(urls) - len(collapsed))
+    return collapsed
+
+
+# Function to add the hash of every catalog image missing from the hashes file
+def build_hashes(csv_path):
+    from catalog import get_catalog
+    from images import append_thumbnail_table
+    catalog = get_catalog(csv_path)
+    known = catalog_hashes(catalog)
+    records = [record for record in catalog.records.by_url.values() if record.file_id and record.url not in known]
+    added = append_thumbnail_table(hashes_path(csv_path), "PHash", records,
+                                   lambda thumbnail: format_hash(perceptual_hash(thumbnail)))
+    return added, len(records)
+
+
+# Offline step: python duplicates.py [repo1.csv]
+if __name__ == "__main__":
+    from catalog import CSV_FILE_PATH
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE_PATH
+    added, missing = build_hashes(csv_path)
+    print(f"Added {added} of {missing} missing hashes to {hashes_path(csv_path)}")
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from search import (AVAILABLE_PLAYERS, DAY_NIGHT_ACTIVITIES, DISTANCE_ACTIVITIES, ENVIRONMENT_ACTIVITIES,
+                    FILTER_ACTIONS, FILTER_ACTIVITIES)
+from search_index import compile_contains_pattern
+
+# Columns the filter tab matches by substring, with the value codes of every row precomputed
+FACET_COLUMNS = ["Action", "Day/Night", "Environment", "ShotType"]
+
+
+class FacetIndex:
+    """Per-player row postings and per-row value codes, for counting the filter tab's matches per option.
+
+    Counts follow filter_images: an image matches when one of the selected players' rows passes every
+    filter and the image holds all the selected players."""
+
+    def __init__(self, df):
+        url_codes, urls = pd.factorize(df["URL"])
+        self.url_codes = url_codes.astype(np.int32)
+        self.urls = urls
+        self.num_urls = len(urls)
+        name_codes, names = pd.factorize(df["Name"])
+        self.name_codes = name_codes.astype(np.int32)
+        self.name_code = {name: code for code, name in enumerate(names)}
+        order = np.argsort(self.name_codes, kind="stable")
+        bounds = np.searchsorted(self.name_codes[order], np.arange(len(names) + 1))
+        self.player_rows = {name: order[bounds[code]:bounds[code + 1]] for name, code in self.name_code.items()}
+        self.player_urls = {}
+        for name, rows in self.player_rows.items():
+            bitmap = np.zeros(self.num_urls, dtype=bool)
+            bitmap[self.url_codes[rows]] = True
+            self.player_urls[name] = bitmap
+        self.value_codes = {}
+        for column in FACET_COLUMNS:
+            if column in df.columns:
+                codes, values = pd.factorize(df[column])
+                self.value_codes[column] = (codes, [str(value) for value in values])
+        self.faces = df["No_of_faces"].to_numpy() if "No_of_faces" in df.columns else None
+        self.dates = df["Date"].to_numpy() if "Date" in df.columns else None
+        known_dates = df["Date"].dropna() if "Date" in df.columns else []
+        # First and last day of the catalog, the filter tab's default date range
+        self.date_range = (known_dates.min().date(), known_dates.max().date()) if len(known_dates) else None
+        self._value_matches = {}
+        # (duplicate index, its group code for every URL) as last computed; see url_groups
+        self._url_groups = None
+
+    def urls_with_all(self, players):
+        bitmap = np.ones(self.num_urls, dtype=bool)
+        for player in players:
+            bitmap &= self.player_urls.get(player, False)
+        return bitmap
+
+    # Bitmap over a column's distinct values of those containing the pattern, like str.contains(case=False)
+    def _matching_values(self, column, pattern):
+        key = (column, pattern)
+        if key not in self._value_matches:
+            regex = compile_contains_pattern(pattern)
+            # One extra False entry for missing values, whose code is -1
+            values = self.value_codes[column][1]
+            self._value_matches[key] = np.array([bool(regex.search(value)) for value in values] + [False])
+        return self._value_matches[key]
+
+    def contains_mask(self, column, pattern, rows):
+        if column not in self.value_codes:
+            return np.zeros(len(rows), dtype=bool)
+        return self._matching_values(column, pattern)[self.value_codes[column][0][rows]]
+
+    def action_mask(self, action, rows):
+        return self.contains_mask("Action", action, rows) if action else np.ones(len(rows), dtype=bool)
+
+    def activity_mask(self, activity, rows):
+        if activity in DAY_NIGHT_ACTIVITIES:
+            return self.contains_mask("Day/Night", activity, rows)
+        if activity in ENVIRONMENT_ACTIVITIES:
+            return self.contains_mask("Environment", activity, rows)
+        if activity in DISTANCE_ACTIVITIES:
+            return self.contains_mask("ShotType", activity, rows)
+        return np.ones(len(rows), dtype=bool)
+
+    def faces_mask(self, no_of_faces, rows):
+        if no_of_faces > 0 and self.faces is not None:
+            return self.faces[rows] == no_of_faces
+        return np.ones(len(rows), dtype=bool)
+
+    def date_mask(self, from_date, to_date, rows):
+        if from_date and to_date and self.dates is not None:
+            dates = self.dates[rows]
+            return (dates >= np.datetime64(from_date, "ns")) & (dates <= np.datetime64(to_date, "ns"))
+        return np.ones(len(rows), dtype=bool)
+
+    # Bitmap of the images of the given rows that pass the mask
+    def urls_of(self, rows, mask):
+        bitmap = np.zeros(self.num_urls, dtype=bool)
+        bitmap[self.url_codes[rows[mask]]] = True
+        return bitmap
+
+    # Near-duplicate group of every URL as a code, for counting what collapse_near_duplicates leaves.
+    # URLs without a hash are never collapsed, so each gets a group of its own.
+    def url_groups(self, duplicate_index):
+        entry = self._url_groups
+        if entry is None or entry[0] is not duplicate_index:
+            codes, _ = pd.factorize(pd.Series([duplicate_index.groups.get(url) for url in self.urls], dtype=object))
+            unhashed = codes < 0
+            codes[unhashed] = codes.max(initial=-1) + 1 + np.arange(np.count_nonzero(unhashed))
+            entry = (duplicate_index, codes)
+            self._url_groups = entry
+        return entry[1]
+
+
+class FacetSelection:
+    """The filter tab's selected players, with their rows and shared images updated as players come and go."""
+
+    def __init__(self, index):
+        self.index = index
+        self.players = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.shared_urls = np.ones(index.num_urls, dtype=bool)
+
+    # Function to bring the selection in line with the tab's player list, touching only what changed
+    def sync(self, players):
+        for player in [player for player in self.players if player not in players]:
+            self.remove(player)
+        for player in players:
+            if player not in self.players:
+                self.add(player)
+
+    def add(self, player):
+        self.players.append(player)
+        self.rows = np.concatenate([self.rows, self.index.player_rows.get(player, self.rows[:0])])
+        self.shared_urls &= self.index.player_urls.get(player, False)
+
+    def remove(self, player):
+        self.players.remove(player)
+        code = self.index.name_code.get(player)
+        if code is not None:
+            self.rows = self.rows[self.index.name_codes[self.rows] != code]
+        # An intersection cannot be undone, so rebuild it from the remaining players' bitmaps
+        self.shared_urls = self.index.urls_with_all(self.players)
+
+
+# Function to count, for the current selection, the images each option of the filter tab would return.
+# Each dimension's counts keep the other dimensions' selections and vary only its own option.
+# With url_groups (see FacetIndex.url_groups), near-duplicates count once, as they are shown once.
+def facet_counts(selection, action=None, activity=None, from_date=None, to_date=None, no_of_faces=0, url_groups=None):
+    index = selection.index
+    rows = selection.rows
+    action_ok = index.action_mask(action, rows)
+    activity_ok = index.activity_mask(activity, rows)
+    others_ok = index.faces_mask(no_of_faces, rows) & index.date_mask(from_date, to_date, rows)
+
+    def count_urls(urls):
+        if url_groups is None:
+            return int(np.count_nonzero(urls))
+        return len(np.unique(url_groups[urls]))
+
+    def count(mask):
+        return count_urls(index.urls_of(rows, mask) & selection.shared_urls)
+
+    counts = {
+        "total": count(action_ok & activity_ok & others_ok),
+        # None counts the images with the dimension left unspecified
+        "Action": {option: count(index.action_mask(option, rows) & activity_ok & others_ok) for option in [None] + FILTER_ACTIONS},
+        "Activity": {option: count(index.activity_mask(option, rows) & action_ok & others_ok) for option in [None] + FILTER_ACTIVITIES},
+        "Players": {},
+    }
+    # Adding a player brings in its rows and narrows the images to those it appears in
+    selected_urls = index.urls_of(rows, action_ok & activity_ok & others_ok)
+    for player in AVAILABLE_PLAYERS:
+        if player in selection.players:
+            continue
+        player_rows = index.player_rows.get(player)
+        if player_rows is None:
+            counts["Players"][player] = 0
+            continue
+        player_ok = (index.action_mask(action, player_rows) & index.activity_mask(activity, player_rows)
+                     & index.faces_mask(no_of_faces, player_rows) & index.date_mask(from_date, to_date, player_rows))
+        urls = (selected_urls | index.urls_of(player_rows, player_ok)) & selection.shared_urls & index.player_urls[player]
+        counts["Players"][player] = count_urls(urls)
+    return counts
@@ -0,0 +1,9 @@
+import multiprocessing
+import os
+
+# gunicorn settings for the search API: gunicorn -c gunicorn.conf.py api:application
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("API_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Load the catalog and its indexes once in the master; forked workers share the memory
+preload_app = True
+timeout = 60
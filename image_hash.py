@@ -0,0 +1,43 @@
+import io
+import numpy as np
+from PIL import Image
+
+# Perceptual hash (pHash): the signs of the low frequencies of a small grayscale copy of the image,
+# which survive resizing, recompression and small edits. Same bits as imagehash.phash.
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = HASH_SIZE * 4
+
+
+# Unnormalized DCT-II matrix, as computed by scipy.fftpack.dct
+def _dct_matrix(size):
+    frequencies = np.arange(size)[:, None]
+    positions = np.arange(size)[None, :]
+    return 2 * np.cos(np.pi * frequencies * (2 * positions + 1) / (2 * size))
+
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+# Function to compute the 64-bit perceptual hash of an image (PIL image or encoded bytes)
+def perceptual_hash(image):
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    pixels = np.asarray(image.convert("L").resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.LANCZOS), dtype=np.float64)
+    # Rounded so that flat areas, whose coefficients are zero up to floating-point noise, hash stably
+    low_frequencies = np.round((_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE], 6)
+    bits = (low_frequencies > np.median(low_frequencies)).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+# Hashes are stored in the catalog as 16 hex digits
+def format_hash(value):
+    return f"{value:016x}"
+
+
+def parse_hash(text):
+    return int(text, 16)
+
+
+# Number of differing bits between two hashes; near-duplicates differ in only a few
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
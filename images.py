@@ -0,0 +1,242 @@
+import csv
+import os
+import random
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from metrics import increment, timed
+from thumbnail_cache import ThumbnailCache, make_thumbnail
+
+# Upper bound on simultaneous downloads from Google Drive, shared by every session in the process
+MAX_CONCURRENT_FETCHES = 8
+# Threads warming the cache for the pages around the one on screen; they share the download limit above
+PREFETCH_WORKERS = 2
+# Seconds to wait for Drive to connect and to send the image
+FETCH_TIMEOUT = (3.05, 10)
+# Seconds one grid image may take over all its attempts, and that a page waits for its images before
+# drawing the page controls; images still downloading then keep their placeholder until the next run
+IMAGE_DEADLINE = 5
+PAGE_DEADLINE = 4
+# Base and cap, in seconds, of the exponential backoff between retries
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 4
+# Status codes worth retrying; anything else (404, 403, ...) fails straight away
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Where thumbnails are kept between runs, and how much disk they may use
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", ".thumbnail_cache")
+THUMBNAIL_CACHE_MAX_MB = int(os.getenv("THUMBNAIL_CACHE_MAX_MB", "500"))
+
+_session = None
+_session_lock = threading.Lock()
+_thumbnail_cache = None
+_thumbnail_cache_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES, thread_name_prefix="image-fetch")
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="image-prefetch")
+# Held for the duration of every Drive request, so prefetching never raises peak concurrency
+_download_slots = threading.BoundedSemaphore(MAX_CONCURRENT_FETCHES)
+# Thumbnails being downloaded right now, so a page and its prefetch never fetch the same file twice
+_pending_thumbnails = {}
+_pending_thumbnails_lock = threading.Lock()
+
+
+# Function to get the keep-alive HTTP session shared by all downloads
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=MAX_CONCURRENT_FETCHES, pool_maxsize=MAX_CONCURRENT_FETCHES)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+# Function to get the on-disk thumbnail cache shared by all sessions
+def get_thumbnail_cache():
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        with _thumbnail_cache_lock:
+            if _thumbnail_cache is None:
+                _thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_MB * 1024 * 1024)
+    return _thumbnail_cache
+
+
+# Direct download link for a Google Drive file ID
+def drive_direct_link(file_id):
+    return f"https://drive.google.com/uc?id={file_id}"
+
+
+# Full-jitter exponential backoff: a random wait between 0 and base * 2^attempt, capped
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+# Function to tell whether a request failed because the server was too slow to send the response. A timeout
+# while reading the body arrives as a ConnectionError wrapping urllib3's ReadTimeoutError.
+def is_read_timeout(error):
+    return isinstance(error, requests.exceptions.ReadTimeout) or \
+        any(isinstance(arg, ReadTimeoutError) for arg in error.args)
+
+
+# Function to fetch the image with retry logic. With a deadline, every attempt, wait for a download slot
+# and backoff fits in that many seconds overall. A read timeout is not retried: Drive accepted the request
+# but is slow to send the file, and another attempt would most likely be just as slow.
+def fetch_image_with_retry(direct_link, retries=3, deadline=None):
+    end_time = time.monotonic() + deadline if deadline is not None else None
+    connect_timeout, read_timeout = FETCH_TIMEOUT
+    for attempt in range(retries):
+        timeout = FETCH_TIMEOUT
+        if end_time is not None:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0 or not _download_slots.acquire(timeout=remaining):
+                increment("fetch_errors_total", reason="deadline")
+                break
+            remaining = max(end_time - time.monotonic(), 0.01)
+            timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+        else:
+            _download_slots.acquire()
+        try:
+            with timed("drive_download"):
+                response = get_session().get(direct_link, timeout=timeout)
+        except requests.RequestException as e:
+            increment("fetch_errors_total", reason="ReadTimeout" if is_read_timeout(e) else type(e).__name__)
+            print(f"Error fetching image: {e}")
+            if is_read_timeout(e):
+                break
+            response = None
+        finally:
+            _download_slots.release()
+        if response is not None:
+            if response.status_code == 200 and "image" in response.headers.get("Content-Type", ""):
+                return response.content
+            increment("fetch_errors_total", reason=str(response.status_code))
+            if response.status_code not in RETRY_STATUS_CODES:
+                print(f"Error fetching image: {direct_link} returned {response.status_code}")
+                return None
+            print(f"Error fetching image: {direct_link} returned {response.status_code}, retrying")
+        if attempt < retries - 1:
+            delay = backoff_delay(attempt)
+            if end_time is not None and time.monotonic() + delay >= end_time:
+                break
+            increment("fetch_retries_total")
+            time.sleep(delay)
+    increment("fetch_failures_total")
+    return None
+
+
+# Function to get the thumbnail of a Drive file, downloading and shrinking the original only on a cache miss
+def fetch_thumbnail(file_id, retries=3, deadline=IMAGE_DEADLINE):
+    cache = get_thumbnail_cache()
+    thumbnail = cache.get(file_id)
+    if thumbnail is not None:
+        increment("cache_requests_total", cache="thumbnail", result="hit")
+        return thumbnail
+    with _pending_thumbnails_lock:
+        pending = _pending_thumbnails.get(file_id)
+        if pending is None:
+            _pending_thumbnails[file_id] = threading.Event()
+    if pending is not None:
+        # Another thread is already downloading this file; wait for it to land in the cache
+        increment("cache_requests_total", cache="thumbnail", result="pending")
+        pending.wait()
+        return cache.get(file_id)
+    increment("cache_requests_total", cache="thumbnail", result="miss")
+    try:
+        return _download_thumbnail(cache, file_id, retries, deadline)
+    finally:
+        with _pending_thumbnails_lock:
+            _pending_thumbnails.pop(file_id).set()
+
+
+def _download_thumbnail(cache, file_id, retries, deadline):
+    image_content = fetch_image_with_retry(drive_direct_link(file_id), retries, deadline)
+    if image_content is None:
+        return None
+    try:
+        with timed("decode"):
+            thumbnail = make_thumbnail(image_content)
+    except Exception as e:
+        increment("decode_errors_total")
+        print(f"Error creating thumbnail for {file_id}: {e}")
+        return None
+    cache.put(file_id, thumbnail)
+    return thumbnail
+
+
+# Function to get several thumbnails, yielding (position, thumbnail) as each one is ready.
+# Cached thumbnails are returned straight away; only misses are downloaded, in parallel.
+# With a deadline, thumbnails not ready within that many seconds are not yielded; their downloads go on
+# in the background and land in the cache for the next run.
+def fetch_thumbnails(file_ids, retries=3, deadline=None):
+    cache = get_thumbnail_cache()
+    cached = []
+    futures = {}
+    for position, file_id in enumerate(file_ids):
+        thumbnail = cache.get(file_id)
+        if thumbnail is not None:
+            increment("cache_requests_total", cache="thumbnail", result="hit")
+            cached.append((position, thumbnail))
+        else:
+            # Run in a copy of the caller's context so the download spans join the caller's trace
+            futures[_executor.submit(contextvars.copy_context().run, fetch_thumbnail, file_id, retries)] = position
+    yield from cached
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            yield futures[future], future.result()
+    except TimeoutError:
+        increment("page_deadline_misses_total", sum(not future.done() for future in futures))
+
+
+# Function to start downloading thumbnails on the fetch threads without waiting for them, so a page's images
+# are on their way before it is drawn; fetch_thumbnails then waits on these downloads instead of repeating them
+def start_thumbnail_fetches(file_ids, retries=3):
+    cache = get_thumbnail_cache()
+    return [_executor.submit(contextvars.copy_context().run, fetch_thumbnail, file_id, retries)
+            for file_id in file_ids if not cache.contains(file_id)]
+
+
+# Function to append a URL -> value table (such as the blurhash or perceptual hash of each image) with
+# compute(thumbnail) for every record. Thumbnails come from the thumbnail cache, downloading only the ones
+# it lacks. Returns the number of rows written.
+def append_thumbnail_table(path, column, records, compute):
+    new_file = not os.path.exists(path)
+    added = 0
+    with open(path, "a", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        if new_file:
+            writer.writerow(["URL", column])
+        for position, thumbnail in fetch_thumbnails([record.file_id for record in records]):
+            if thumbnail:
+                writer.writerow([records[position].url, compute(thumbnail)])
+                added += 1
+    return added
+
+
+class PrefetchJob:
+    """Background download of thumbnails that are likely to be viewed next."""
+
+    def __init__(self, file_ids):
+        self.cancelled = threading.Event()
+        self.futures = [_prefetch_executor.submit(self._prefetch, file_id) for file_id in file_ids]
+
+    def _prefetch(self, file_id):
+        if not self.cancelled.is_set():
+            fetch_thumbnail(file_id)
+
+    # Drop the downloads that have not started yet; ones already in flight still fill the cache
+    def cancel(self):
+        self.cancelled.set()
+        for future in self.futures:
+            future.cancel()
+
+
+# Function to warm the thumbnail cache for the given Drive file IDs in the background
+def prefetch_thumbnails(file_ids):
+    cache = get_thumbnail_cache()
+    return PrefetchJob([file_id for file_id in file_ids if not cache.contains(file_id)])
@@ -0,0 +1,170 @@
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from PIL import Image
+from dotenv import load_dotenv
+from catalog import CSV_FILE_PATH, get_catalog, prepare_catalog_frame, read_catalog_frame
+from catalog_store import append_new_rows, store_exists, store_path, sync_csv_rows
+from image_hash import format_hash, perceptual_hash
+from placeholders import encode_blurhash
+from records import local_thumbnail_key
+from thumbnail_cache import TRANSPOSED_ORIENTATIONS, make_thumbnail
+
+# Ingestion of new photos: every image is analysed in a worker process (EXIF date and make, dimensions,
+# thumbnail, perceptual hash and blurhash) and the results are appended to the catalog's columnar store.
+# Face counts, day/night, shot type and captions need models and are left empty for now.
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+# Images analysed between two writes to the store; a crash loses at most this many
+BATCH_SIZE = 200
+# EXIF tags
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 36867
+DATE_TIME = 306
+MAKE = 271
+ORIENTATION = 0x0112
+# Columns of the rows written for new images, in the CSV's order followed by the ones only ingestion fills
+ROW_COLUMNS = ["ID", "URL", "Name", "Make", "Day/Night", "Environment", "ShotType", "Date", "No_of_faces",
+               "Captions", "Action", "Location", "Width", "Height", "PHash", "Blurhash"]
+
+
+# Function to list the images under a local folder as ingestion items
+def list_folder(path):
+    items = []
+    for directory, _, names in os.walk(path):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                full_path = os.path.abspath(os.path.join(directory, name))
+                items.append({"id": name, "url": full_path, "path": full_path, "file_id": None})
+    return items
+
+
+# Function to list Drive files from a saved listing (JSONL or CSV with id and name fields, as returned by
+# the Drive files.list API) as ingestion items
+def list_drive_listing(path):
+    with open(path, newline="", encoding="utf-8") as source:
+        if path.endswith(".csv"):
+            entries = list(csv.DictReader(source))
+        else:
+            entries = [json.loads(line) for line in source if line.strip()]
+    return [{"id": entry["name"], "url": f"https://drive.google.com/file/d/{entry['id']}/view?usp=drivesdk",
+             "path": None, "file_id": entry["id"]}
+            for entry in entries if os.path.splitext(entry["name"])[1].lower() in IMAGE_EXTENSIONS]
+
+
+# Key of an item's thumbnail in the thumbnail cache: its Drive file ID, or a hash of its path,
+# which the app reads for images that are not on Drive
+def thumbnail_key(item):
+    return item["file_id"] or local_thumbnail_key(item["url"])
+
+
+# Function to read an item's original bytes from disk or Drive
+def read_image_content(item):
+    if item["path"]:
+        with open(item["path"], "rb") as f:
+            return f.read()
+    from images import drive_direct_link, fetch_image_with_retry
+    return fetch_image_with_retry(drive_direct_link(item["file_id"]))
+
+
+# EXIF "2023:05:21 08:47:29" -> "21/05/2023", the catalog's date format
+def exif_date(value):
+    try:
+        return time.strftime("%d/%m/%Y", time.strptime(str(value).strip()[:10], "%Y:%m:%d"))
+    except ValueError:
+        return None
+
+
+# Function to analyse one image; runs in a worker process and returns the item's catalog fields and thumbnail
+def analyze_image(item):
+    content = read_image_content(item)
+    if content is None:
+        raise ValueError("could not read the image")
+    image = Image.open(io.BytesIO(content))
+    exif = image.getexif()
+    width, height = image.size
+    if exif.get(ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    make = exif.get(MAKE)
+    thumbnail = make_thumbnail(content)
+    fields = {
+        "Date": exif_date(exif.get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL) or exif.get(DATE_TIME)),
+        "Make": (make.strip("\x00 ") or None) if isinstance(make, str) else None,
+        "Width": width,
+        "Height": height,
+        "PHash": format_hash(perceptual_hash(thumbnail)),
+        "Blurhash": encode_blurhash(thumbnail),
+    }
+    return fields, thumbnail
+
+
+# Function to write analysed images into the store, creating it from the CSV first if needed
+def write_rows(csv_path, rows):
+    path = store_path(csv_path)
+    # Object columns, so the columns no image has a value for yet stay text-typed rather than float NaN
+    df = prepare_catalog_frame(pd.DataFrame(rows, columns=ROW_COLUMNS, dtype=object))
+    df[["Width", "Height"]] = df[["Width", "Height"]].astype("int32")
+    if not store_exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+        # The CSV was edited after the last ingestion; bring the store in line with it before adding to it
+        sync_csv_rows(path, read_catalog_frame(csv_path))
+    return append_new_rows(path, df)
+
+
+# Function to ingest the items the catalog does not hold yet. Items are identified by URL (Drive link or
+# absolute path), since file names such as DSC0001.jpg repeat across shoots; the file name only becomes the ID.
+# Items that fail are reported and left out, so the next run retries them.
+# Returns the number of images added and the number that failed.
+def ingest(items, csv_path=CSV_FILE_PATH, location=None, workers=None, batch_size=BATCH_SIZE):
+    from images import get_thumbnail_cache
+    known_urls = set(get_catalog(csv_path).df["URL"].astype(str))
+    items = [item for item in items if item["url"] not in known_urls]
+    # The same file listed twice is analysed once
+    items = list({item["url"]: item for item in items}.values())
+    if not items:
+        return 0, 0
+    cache = get_thumbnail_cache()
+    added = failed = 0
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(analyze_image, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                fields, thumbnail = future.result()
+            except Exception as e:
+                print(f"Error ingesting {item['url']}: {e}")
+                failed += 1
+                continue
+            cache.put(thumbnail_key(item), thumbnail)
+            rows.append({"ID": item["id"], "URL": item["url"], "Location": location, **fields})
+            if len(rows) >= batch_size:
+                added += write_rows(csv_path, rows)
+                print(f"Ingested {added} of {len(items)} images")
+                rows = []
+    if rows:
+        added += write_rows(csv_path, rows)
+    return added, failed
+
+
+# Add new photos to the catalog: python ingest.py FOLDER or python ingest.py --drive-listing files.jsonl
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Analyse new photos in parallel and append them to the catalog's columnar store.")
+    parser.add_argument("folder", nargs="?", help="local folder of photos, searched recursively")
+    parser.add_argument("--drive-listing", help="JSONL or CSV listing of Drive files (id and name) to ingest instead of a folder")
+    parser.add_argument("--catalog", default=CSV_FILE_PATH, help="catalog CSV whose store receives the new rows")
+    parser.add_argument("--location", help="value of the Location column for every new image")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="images analysed between writes to the store")
+    args = parser.parse_args()
+    if bool(args.folder) == bool(args.drive_listing):
+        parser.error("give either a folder or --drive-listing")
+    items = list_drive_listing(args.drive_listing) if args.drive_listing else list_folder(args.folder)
+    started = time.perf_counter()
+    added, failed = ingest(items, args.catalog, args.location, args.workers, args.batch_size)
+    print(f"Added {added} images to {store_path(args.catalog)} in {time.perf_counter() - started:.1f}s"
+          + (f"; {failed} failed and will be retried on the next run" if failed else ""))
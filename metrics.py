@@ -0,0 +1,157 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "imagesearch"
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Print every timed stage as a JSON line on stderr, for log-based collection
+METRICS_LOG = os.getenv("METRICS_LOG", "") not in ("", "0")
+# Port of the Prometheus endpoint started by the Streamlit app; unset means no endpoint
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Counters and histograms of this process, keyed by metric name and sorted label pairs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(value)
+
+    # Function to export every metric in the Prometheus text format
+    def render(self):
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{METRIC_PREFIX}_{name}{format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{METRIC_PREFIX}_{name}_bucket{format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_sum{format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{METRIC_PREFIX}_{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+_registry = MetricsRegistry()
+# Spans of the request being handled; set per Streamlit run and copied into the download threads
+_trace = contextvars.ContextVar("trace", default=None)
+_server = None
+_server_lock = threading.Lock()
+
+
+# Function to add to a counter, e.g. increment("cache_requests_total", cache="thumbnail", result="hit")
+def increment(name, amount=1, **labels):
+    _registry.increment(name, labels, amount)
+
+
+# Function to time a block as one stage of a request: stage_seconds histogram, the current trace and the log
+@contextmanager
+def timed(stage, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _registry.observe("stage_seconds", {"stage": stage, **labels}, elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append({"stage": stage, "ms": round(elapsed * 1000, 2), **labels})
+        if METRICS_LOG:
+            print(json.dumps({"event": "stage", "stage": stage, "seconds": round(elapsed, 6), **labels}),
+                  file=sys.stderr, flush=True)
+
+
+# Function to start collecting the spans of a new request; returns the list they are appended to
+def start_trace():
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+# Function to get the current value of every counter, for the debug panel
+def get_counters():
+    with _registry.lock:
+        return {(name, labels): value for (name, labels), value in _registry.counters.items()}
+
+
+def render_prometheus():
+    return _registry.render()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def metrics_application(environ, start_response):
+    if environ.get("PATH_INFO", "") != "/metrics":
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"Not found\n"]
+    payload = render_prometheus().encode("utf-8")
+    start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4"), ("Content-Length", str(len(payload)))])
+    return [payload]
+
+
+# Function to serve /metrics from a background thread, once per process
+def start_metrics_server(port=METRICS_PORT):
+    global _server
+    if not port or _server is not None:
+        return _server
+    with _server_lock:
+        if _server is None:
+            server = make_server("0.0.0.0", int(port), metrics_application, handler_class=QuietRequestHandler)
+            threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+            _server = server
+    return _server
@@ -0,0 +1,175 @@
+import csv
+import io
+import os
+import sys
+import threading
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+
+# Blurhash placeholders: a ~30-character string per image that decodes to a blurred preview,
+# shown in a grid cell while its thumbnail downloads. See https://blurha.sh for the format.
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+BASE83_VALUES = {character: value for value, character in enumerate(BASE83_CHARACTERS)}
+# Horizontal and vertical cosine components kept per image
+COMPONENTS_X = 4
+COMPONENTS_Y = 3
+# Images are shrunk to this width before encoding; a blurhash holds no more detail than that
+ENCODE_WIDTH = 32
+# Size of the decoded preview; the browser scales it up to the cell, which adds to the blur
+PLACEHOLDER_SIZE = (32, 24)
+
+
+def encode_base83(value, length):
+    return "".join(BASE83_CHARACTERS[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def decode_base83(text):
+    value = 0
+    for character in text:
+        value = value * 83 + BASE83_VALUES[character]
+    return value
+
+
+def srgb_to_linear(values):
+    values = np.asarray(values, dtype=np.float64) / 255
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values):
+    values = np.clip(values, 0, 1)
+    srgb = np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+    return np.round(srgb * 255).astype(np.uint8)
+
+
+def sign_pow(values, exponent):
+    return np.sign(values) * np.abs(values) ** exponent
+
+
+# Function to compute the blurhash of an image (PIL image or encoded bytes)
+def encode_blurhash(image, components_x=COMPONENTS_X, components_y=COMPONENTS_Y):
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    image = image.convert("RGB")
+    image.thumbnail((ENCODE_WIDTH, ENCODE_WIDTH * 4))
+    pixels = srgb_to_linear(np.asarray(image))
+    height, width = pixels.shape[:2]
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    # factors[j, i] = normalization * mean over pixels of pixel * cos_x(i) * cos_y(j)
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, pixels) / (width * height)
+    factors *= 2
+    factors[0, 0] /= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+    blurhash = encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantized_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        maximum = (quantized_max + 1) / 166
+    else:
+        quantized_max, maximum = 0, 1
+    blurhash += encode_base83(quantized_max, 1)
+    r, g, b = linear_to_srgb(dc).astype(int)
+    blurhash += encode_base83((r << 16) + (g << 8) + b, 4)
+    quantized = np.clip(np.floor(sign_pow(ac / maximum, 0.5) * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantized:
+        blurhash += encode_base83(qr * 19 * 19 + qg * 19 + qb, 2)
+    return blurhash
+
+
+# Function to decode a blurhash into an RGB array of the given size
+def decode_blurhash(blurhash, width, height):
+    size_flag = decode_base83(blurhash[0])
+    components_y, components_x = size_flag // 9 + 1, size_flag % 9 + 1
+    if len(blurhash) != 4 + 2 * components_x * components_y:
+        raise ValueError(f"Invalid blurhash length: {blurhash}")
+    maximum = (decode_base83(blurhash[1]) + 1) / 166
+    value = decode_base83(blurhash[2:6])
+    colors = [srgb_to_linear([value >> 16, (value >> 8) & 255, value & 255])]
+    for i in range(1, components_x * components_y):
+        value = decode_base83(blurhash[4 + i * 2:6 + i * 2])
+        quantized = np.array([value // (19 * 19), (value // 19) % 19, value % 19])
+        colors.append(sign_pow((quantized - 9) / 9, 2) * maximum)
+    colors = np.array(colors).reshape(components_y, components_x, 3)
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    return linear_to_srgb(np.einsum("jy,ix,jic->yxc", basis_y, basis_x, colors))
+
+
+# Function to get the preview of a blurhash as PNG bytes, or None for a missing or broken blurhash
+@lru_cache(maxsize=4096)
+def placeholder_image(blurhash):
+    if not isinstance(blurhash, str) or not blurhash:
+        return None
+    try:
+        pixels = decode_blurhash(blurhash, *PLACEHOLDER_SIZE)
+    except (KeyError, ValueError):
+        return None
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, "PNG")
+    return output.getvalue()
+
+
+# Path of the URL -> blurhash table kept next to a catalog CSV
+def placeholders_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".placeholders.csv"
+
+
+class PlaceholderStore:
+    """Blurhash per image URL, read from the CSV written by python placeholders.py."""
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.blurhashes = {}
+        if mtime is not None:
+            with open(path, newline="", encoding="utf-8") as source:
+                for row in csv.DictReader(source):
+                    self.blurhashes[row["URL"]] = row["Blurhash"]
+
+    def get(self, url):
+        return self.blurhashes.get(url)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+# Function to get the placeholders of a catalog, reloading them when the file changes
+def get_placeholder_store(csv_path):
+    path = placeholders_path(csv_path)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    store = _stores.get(path)
+    if store is None or store.mtime != mtime:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None or store.mtime != mtime:
+                store = PlaceholderStore(path, mtime)
+                _stores[path] = store
+    return store
+
+
+# Function to get the preview shown while a record's thumbnail loads: the catalog's own Blurhash column
+# when it has one, otherwise the placeholders file. Returns PNG bytes or None.
+def get_placeholder(catalog, record):
+    return placeholder_image(record.blurhash or get_placeholder_store(catalog.path).get(record.url))
+
+
+# Function to add the blurhash of every catalog image missing from the placeholders file
+def build_placeholders(csv_path):
+    from catalog import get_catalog
+    from images import append_thumbnail_table
+    catalog = get_catalog(csv_path)
+    store = get_placeholder_store(csv_path)
+    records = [record for record in catalog.records.by_url.values()
+               if record.file_id and not record.blurhash and store.get(record.url) is None]
+    added = append_thumbnail_table(placeholders_path(csv_path), "Blurhash", records, encode_blurhash)
+    return added, len(records)
+
+
+# Offline step: python placeholders.py [repo1.csv]
+if __name__ == "__main__":
+    from catalog import CSV_FILE_PATH
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE_PATH
+    added, missing = build_placeholders(csv_path)
+    print(f"Added {added} of {missing} missing placeholders to {placeholders_path(csv_path)}")
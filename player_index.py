@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+
+class PlayerIndex:
+    """Sorted posting list of images per player, plus a table of how many images every pair of players shares."""
+
+    def __init__(self, keys, image_codes, names):
+        # keys[i] is the ID or URL of image i
+        self.keys = np.asarray(keys)
+        pairs = pd.DataFrame({"image": image_codes, "player": names.astype(object)}).dropna().drop_duplicates()
+        player_codes, players = pd.factorize(pairs["player"])
+        self.players = list(players)
+        self.code = {player: code for code, player in enumerate(self.players)}
+        images = pairs["image"].to_numpy(dtype=np.int64)
+        order = np.lexsort((images, player_codes))
+        bounds = np.searchsorted(player_codes[order], np.arange(len(self.players) + 1))
+        self.postings = [images[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.players))]
+        self.cooccurrence = self._count_pairs(images, player_codes)
+
+    @classmethod
+    def from_frame(cls, df, key="ID"):
+        # IDs are numbered in sorted order, like the search index; URLs in order of appearance
+        codes, keys = pd.factorize(df[key], sort=key == "ID")
+        return cls(keys, codes, df["Name"])
+
+    # Function to count the images shared by every pair of players; the diagonal holds each player's image count.
+    # Images are grouped by their number of players, so each group adds its pairs with one vectorized call.
+    def _count_pairs(self, images, player_codes):
+        size = len(self.players)
+        counts = np.zeros((size, size), dtype=np.int32)
+        order = np.argsort(images, kind="stable")
+        images, player_codes = images[order], player_codes[order]
+        starts = np.flatnonzero(np.r_[True, images[1:] != images[:-1]])
+        lengths = np.diff(np.r_[starts, len(images)])
+        for length in np.unique(lengths):
+            group_starts = starts[lengths == length]
+            members = player_codes[group_starts[:, None] + np.arange(length)]
+            for i in range(length):
+                for j in range(length):
+                    np.add.at(counts, (members[:, i], members[:, j]), 1)
+        return counts
+
+    # Sorted positions of the images holding every one of the players, intersecting the shortest lists first
+    def images_with_all(self, players):
+        lists = []
+        for player in set(players):
+            code = self.code.get(player)
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            lists.append(self.postings[code])
+        if not lists:
+            return np.arange(len(self.keys))
+        lists.sort(key=len)
+        result = lists[0]
+        for posting in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def bitmap_with_all(self, players):
+        bitmap = np.zeros(len(self.keys), dtype=bool)
+        bitmap[self.images_with_all(players)] = True
+        return bitmap
+
+    def keys_with_all(self, players):
+        return self.keys[self.images_with_all(players)]
+
+    # Players who appear most often in the player's images, as (player, images together), most first
+    def most_with(self, player, top=5):
+        code = self.code.get(player)
+        if code is None:
+            return []
+        row = self.cooccurrence[code].copy()
+        row[code] = 0
+        ranked = np.argsort(-row, kind="stable")[:top]
+        return [(self.players[i], int(row[i])) for i in ranked if row[i] > 0]
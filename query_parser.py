@@ -0,0 +1,322 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+from metrics import increment, timed
+
+# Actions the parser may return, as listed in the Gemini prompt
+ACTIONS = ["posing", "walking", "playing", "bowling", "batting", "observing", "speaking", "celebrating",
+           "discussion", "award ceremony", "sitting", "standing", "laughing", "smiling", "eating", "event",
+           "departure", "greeting", "running", "cheering"]
+# Words the local parser can safely ignore in a query
+FILLER_WORDS = {"a", "an", "the", "of", "and", "with", "in", "at", "on", "is", "are", "while", "together",
+                "show", "me", "find", "get", "give", "all", "some", "any", "please",
+                "image", "images", "photo", "photos", "picture", "pictures", "pic", "pics",
+                "player", "players", "person", "people"}
+# Queries sent to Gemini in one prompt by the batch search, and prompts in flight at once
+GEMINI_BATCH_SIZE = 20
+GEMINI_CONCURRENCY = 4
+# Where parsed Gemini responses are kept, and for how long
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", ".query_cache.sqlite3")
+QUERY_CACHE_TTL_HOURS = float(os.getenv("QUERY_CACHE_TTL_HOURS", "168"))
+
+_model = None
+_model_lock = threading.Lock()
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+# Function to get the Gemini model, configured on first use
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                genai.configure(api_key=os.getenv("API_KEY"))
+                _model = genai.GenerativeModel("gemini-1.5-flash")
+    return _model
+
+
+def parse_query_with_gemini(user_query):
+    prompt = f"""
+    You are an assistant for a sports analytics platform. Parse the following query into structured parameters:
+    Query: "{user_query}"
+    Output format:
+    {{"Players": [List of player names], "Action": "Action type" Any one of the given({", ".join(ACTIONS)})(optional), "Environment": "Environment type (optional)", "Day/Night": "Day or Night (optional)", "ShotType": "Type of shot (optional)", "Date": "Date (optional)", "Location": "Location (optional)", "Results": "Number of results (optional)"}}
+    """
+    response = get_model().generate_content(prompt)
+    return response.text
+
+
+# Function to parse several queries with one Gemini call; the response should be a JSON array in query order
+def parse_queries_with_gemini(user_queries):
+    numbered_queries = "\n".join(f'    {i + 1}. "{user_query}"' for i, user_query in enumerate(user_queries))
+    prompt = f"""
+    You are an assistant for a sports analytics platform. Parse each of the following queries into structured parameters:
+{numbered_queries}
+    Output a JSON array with exactly one object per query, in the same order, each in the format:
+    {{"Players": [List of player names], "Action": "Action type" Any one of the given({", ".join(ACTIONS)})(optional), "Environment": "Environment type (optional)", "Day/Night": "Day or Night (optional)", "ShotType": "Type of shot (optional)", "Date": "Date (optional)", "Location": "Location (optional)", "Results": "Number of results (optional)"}}
+    """
+    response = get_model().generate_content(prompt)
+    return response.text
+
+
+# Function to pull the JSON array out of a batched Gemini response, or None unless it holds one object per query
+def extract_json_list(response_text, count):
+    cleaned_response = response_text.strip("```").strip()
+    start_idx = cleaned_response.find("[")
+    end_idx = cleaned_response.rfind("]") + 1
+    try:
+        parsed = json.loads(cleaned_response[start_idx:end_idx]) if start_idx >= 0 else None
+    except ValueError:
+        return None
+    if not isinstance(parsed, list) or len(parsed) != count or not all(isinstance(item, dict) for item in parsed):
+        return None
+    return parsed
+
+
+# Function to pull the JSON object out of a Gemini response, or None when there is none
+def extract_json(response_text):
+    cleaned_response = response_text.strip("```").strip()
+    start_idx = cleaned_response.find("{")
+    end_idx = cleaned_response.rfind("}") + 1
+    valid_json = cleaned_response[start_idx:end_idx]
+    if not valid_json:
+        return None
+    return json.loads(valid_json)
+
+
+# Function to normalize a query so that trivially different spellings share a cache entry
+def normalize_query(user_query):
+    return " ".join(re.findall(r"[a-z0-9]+", user_query.lower()))
+
+
+class QueryCache:
+    """SQLite table of normalized query -> parsed JSON, with entries expiring after ttl seconds."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS parsed_queries (query TEXT PRIMARY KEY, parsed TEXT, created REAL)"
+            )
+
+    # A connection per call keeps the cache safe to use from any thread or worker process
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, query):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT parsed FROM parsed_queries WHERE query = ? AND created > ?",
+                (query, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, query, parsed):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO parsed_queries (query, parsed, created) VALUES (?, ?, ?)",
+                (query, json.dumps(parsed), time.time()),
+            )
+
+
+# Function to get the query cache shared by all sessions
+def get_query_cache():
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = QueryCache(QUERY_CACHE_PATH, QUERY_CACHE_TTL_HOURS * 3600)
+    return _query_cache
+
+
+# Function to check whether words[i] of a normalized query is the number of results asked for, as in
+# "10 images" (see get_num_results in search.py). Any other number, such as a date, is part of the search.
+def is_result_count(words, i):
+    if re.fullmatch(r"\d+images?", words[i]):
+        return True
+    return words[i].isdigit() and i + 1 < len(words) and words[i + 1] in ("image", "images")
+
+
+class LocalQueryParser:
+    """Resolves simple queries made only of known players, actions and attributes without calling Gemini."""
+
+    def __init__(self, players, locations=()):
+        # phrase (tuple of words) -> (output field, value)
+        self.phrases = {}
+        last_names = {}
+        for player in players:
+            words = tuple(normalize_query(player).split())
+            self.phrases[words] = ("Players", player)
+            last_names.setdefault(words[-1], []).append(player)
+        # A last name on its own ("Dhoni") names a player only when no one else shares it
+        for last_name, owners in last_names.items():
+            if len(owners) == 1 and (last_name,) not in self.phrases:
+                self.phrases[(last_name,)] = ("Players", owners[0])
+        for action in ACTIONS:
+            self.phrases[tuple(action.split())] = ("Action", action)
+        for day_night in ["day", "night"]:
+            self.phrases[(day_night,)] = ("Day/Night", day_night)
+        for environment in ["indoor", "outdoor"]:
+            self.phrases[(environment,)] = ("Environment", environment)
+        for location in locations:
+            self.phrases[tuple(normalize_query(location).split())] = ("Location", location)
+        self.longest_phrase = max(len(phrase) for phrase in self.phrases)
+
+    # Function to walk the words of a query, matching the longest known phrase at each position.
+    # Yields (field, value) for every known phrase and (None, position) for every other word.
+    def match_phrases(self, words):
+        i = 0
+        while i < len(words):
+            for length in range(min(self.longest_phrase, len(words) - i), 0, -1):
+                match = self.phrases.get(tuple(words[i:i + length]))
+                if match:
+                    yield match
+                    i += length
+                    break
+            else:
+                yield None, i
+                i += 1
+
+    # Function to pick out the known players, actions and attributes of a normalized query.
+    # Returns the parsed fields and the words it could not explain, or None when the query names
+    # two different values for the same field.
+    def extract(self, normalized_query):
+        words = normalized_query.split()
+        parsed = {"Players": []}
+        unknown_words = []
+        for field, value in self.match_phrases(words):
+            if field is None:
+                # Filler words and result counts carry no meaning for the search
+                if words[value] not in FILLER_WORDS and not is_result_count(words, value):
+                    unknown_words.append(words[value])
+            elif field == "Players":
+                if value not in parsed["Players"]:
+                    parsed["Players"].append(value)
+            elif parsed.get(field, value) != value:
+                return None
+            else:
+                parsed[field] = value
+        return parsed, unknown_words
+
+    # Function to find the players named in a normalized query, in query order
+    def find_players(self, normalized_query):
+        players = []
+        for field, value in self.match_phrases(normalized_query.split()):
+            if field == "Players" and value not in players:
+                players.append(value)
+        return players
+
+    # Function to parse a normalized query, or return None when it needs Gemini
+    def parse(self, normalized_query):
+        extracted = self.extract(normalized_query)
+        if extracted is None:
+            return None
+        parsed, unknown_words = extracted
+        # Any word the parser cannot explain, or a query with nothing to search for, is ambiguous
+        if unknown_words or (len(parsed) == 1 and not parsed["Players"]):
+            return None
+        return parsed
+
+
+# Function to turn a user query into search parameters without calling Gemini: local parser, then cached result.
+# Returns None when the query needs Gemini.
+def parse_query_offline(user_query, local_parser=None):
+    normalized_query = normalize_query(user_query)
+    if local_parser is not None:
+        parsed = local_parser.parse(normalized_query)
+        if parsed is not None:
+            increment("query_parses_total", parser="local")
+            return parsed
+    parsed = get_query_cache().get(normalized_query)
+    if parsed is not None:
+        increment("cache_requests_total", cache="query", result="hit")
+        return parsed
+    increment("cache_requests_total", cache="query", result="miss")
+    return None
+
+
+# Function to parse a user query with Gemini and cache the result. Returns None when Gemini's response holds no JSON.
+def parse_query_online(user_query):
+    increment("query_parses_total", parser="gemini")
+    with timed("gemini_parse"):
+        response_text = parse_query_with_gemini(user_query)
+    parsed = extract_json(response_text)
+    if parsed is not None:
+        get_query_cache().put(normalize_query(user_query), parsed)
+    return parsed
+
+
+# Function to turn a user query into search parameters: local parser, then cached result, then Gemini.
+# Returns None when Gemini's response holds no JSON.
+def parse_query(user_query, local_parser=None):
+    parsed = parse_query_offline(user_query, local_parser)
+    return parsed if parsed is not None else parse_query_online(user_query)
+
+
+# Function to parse one batch of queries with Gemini, falling back to one call per query when the
+# batched response cannot be matched up with the queries
+def _parse_batch_with_gemini(user_queries):
+    increment("query_parses_total", len(user_queries), parser="gemini")
+    try:
+        with timed("gemini_parse_batch"):
+            response_text = parse_queries_with_gemini(user_queries)
+        parsed = extract_json_list(response_text, len(user_queries))
+    except Exception as e:
+        print(f"Error parsing a batch of {len(user_queries)} queries: {e}")
+        parsed = None
+    if parsed is not None:
+        return parsed
+    increment("gemini_batch_fallbacks_total")
+    results = []
+    for user_query in user_queries:
+        try:
+            with timed("gemini_parse"):
+                response_text = parse_query_with_gemini(user_query)
+            results.append(extract_json(response_text))
+        except Exception as e:
+            print(f"Error parsing query '{user_query}': {e}")
+            results.append(None)
+    return results
+
+
+# Function to parse many queries at once, like parse_query: local parser, then cache, then Gemini,
+# which gets the remaining distinct queries in batches. Returns one result per query, None when parsing failed.
+def parse_queries(user_queries, local_parser=None, batch_size=GEMINI_BATCH_SIZE):
+    results = [None] * len(user_queries)
+    pending = {}
+    cache = get_query_cache()
+    for position, user_query in enumerate(user_queries):
+        normalized_query = normalize_query(user_query)
+        parsed = local_parser.parse(normalized_query) if local_parser is not None else None
+        if parsed is not None:
+            increment("query_parses_total", parser="local")
+            results[position] = parsed
+            continue
+        if normalized_query in pending:
+            pending[normalized_query][1].append(position)
+            continue
+        parsed = cache.get(normalized_query)
+        if parsed is not None:
+            increment("cache_requests_total", cache="query", result="hit")
+            results[position] = parsed
+            continue
+        increment("cache_requests_total", cache="query", result="miss")
+        pending[normalized_query] = (user_query, [position])
+    normalized_queries = list(pending)
+    batches = [normalized_queries[i:i + batch_size] for i in range(0, len(normalized_queries), batch_size)]
+    with ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY) as executor:
+        parsed_batches = executor.map(lambda batch: _parse_batch_with_gemini([pending[q][0] for q in batch]), batches)
+        for batch, parsed_batch in zip(batches, parsed_batches):
+            for normalized_query, parsed in zip(batch, parsed_batch):
+                if parsed is not None:
+                    cache.put(normalized_query, parsed)
+                for position in pending[normalized_query][1]:
+                    results[position] = parsed
+    return results
@@ -0,0 +1,91 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from caption_index import parse_captions
+
+
+# Function to extract the file ID from a Google Drive URL
+def get_drive_file_id(url):
+    return url.split("/")[-2]
+
+
+# Thumbnail cache key of an image that is not on Drive, such as a photo ingested from a local folder
+def local_thumbnail_key(url):
+    return "local-" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+
+
+class ImageRecord:
+    """Everything the app needs to show and filter one image, gathered from all of its catalog rows."""
+
+    __slots__ = ("id", "url", "file_id", "view_link", "captions", "players", "actions", "make", "day_night",
+                 "environment", "shot_type", "date", "no_of_faces", "location", "blurhash")
+
+    def __init__(self, image_id, url, row):
+        self.id = image_id
+        self.url = url
+        self.file_id = get_drive_file_id(url) if "drive.google.com" in url else None
+        self.view_link = f"https://drive.google.com/file/d/{self.file_id}/view" if self.file_id else url
+        self.captions = []
+        self.players = set()
+        self.actions = set()
+        # Single-valued attributes come from the image's first row, like the text search
+        self.make = row.get("Make")
+        self.day_night = row.get("Day/Night")
+        self.environment = row.get("Environment")
+        self.shot_type = row.get("ShotType")
+        self.date = row.get("Date")
+        self.no_of_faces = row.get("No_of_faces")
+        self.location = row.get("Location")
+        # Precomputed preview shown while the thumbnail loads, when the catalog has one
+        blurhash = row.get("Blurhash")
+        self.blurhash = blurhash if isinstance(blurhash, str) and blurhash else None
+
+    def add_captions(self, captions):
+        for caption in captions:
+            if caption not in self.captions:
+                self.captions.append(caption)
+
+    def add_player(self, name):
+        self.players.add(name)
+
+    def add_action(self, action):
+        self.actions.add(action)
+
+
+# Columns gathered from every row of an image, with the record method that takes each value
+MULTI_ROW_COLUMNS = [("Captions", ImageRecord.add_captions), ("Name", ImageRecord.add_player), ("Action", ImageRecord.add_action)]
+
+
+class RecordStore:
+    """Per-image records built once per catalog version, looked up by URL or by image ID."""
+
+    def __init__(self, df):
+        self.by_url = {}
+        self.by_id = {}
+        # Single-valued attributes come from each URL's first row, the only rows turned into dicts
+        codes, urls = pd.factorize(df["URL"])
+        _, first_rows = np.unique(codes, return_index=True)
+        first = df.iloc[first_rows]
+        columns = list(first.columns)
+        records = []
+        for url, values in zip(urls, zip(*(first[column].tolist() for column in columns))):
+            row = dict(zip(columns, values))
+            record = ImageRecord(row["ID"], url, row)
+            self.by_url[url] = record
+            # An ID shared by several URLs maps to its first one, as in the text search
+            self.by_id.setdefault(row["ID"], record)
+            records.append(record)
+        # Every distinct value of an image's rows, in row order. All of an image's rows usually carry the same
+        # Captions string, so repeated (image, value) pairs are dropped and each distinct string is parsed once.
+        for column, add in MULTI_ROW_COLUMNS:
+            if column in df.columns:
+                pairs = pd.DataFrame({"code": codes, "value": df[column].astype(object)}).dropna().drop_duplicates()
+                values = pairs["value"].tolist()
+                if column == "Captions":
+                    parsed = {value: parse_captions(value) for value in pd.unique(pairs["value"])}
+                    values = [parsed[value] for value in values]
+                for code, value in zip(pairs["code"].tolist(), values):
+                    add(records[code], value)
+
+    def __len__(self):
+        return len(self.by_url)
@@ -0,0 +1,76 @@
+import os
+import threading
+from collections import OrderedDict
+from metrics import increment
+
+# Searches whose results are kept in memory, shared by every session in the process
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+
+class ResultCache:
+    """LRU of search results keyed by catalog version, search kind and canonical filters."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # Latest version seen for each catalog path; results of older versions are dropped when it changes
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def _invalidate(self, version):
+        path = version[0]
+        if self.versions.get(path) != version:
+            for key in [key for key in self.entries if key[0][0] == path]:
+                del self.entries[key]
+            self.versions[path] = version
+
+    # Function to get the cached results of a search, running compute() and keeping its results on a miss.
+    # Results are stored as tuples and returned as new lists, so callers cannot change the cached copy.
+    def get_or_compute(self, version, kind, filters, compute):
+        key = (version, kind, filters)
+        with self.lock:
+            self._invalidate(version)
+            results = self.entries.get(key)
+            if results is not None:
+                self.entries.move_to_end(key)
+        if results is not None:
+            increment("cache_requests_total", cache="results", result="hit")
+            return list(results)
+        increment("cache_requests_total", cache="results", result="miss")
+        # Computed outside the lock; two sessions missing on the same search at once both compute it
+        results = tuple(compute())
+        with self.lock:
+            if self.versions.get(version[0]) == version:
+                self.entries[key] = results
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return list(results)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+# Function to get the result cache shared by all sessions
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(RESULT_CACHE_SIZE)
+    return _result_cache
+
+
+# Function to turn a player list into a cache key part: order and repeats do not change any search
+def canonical_players(players):
+    return tuple(sorted(set(players or [])))
+
+
+# Function to turn an optional text filter into a cache key part, treating "" like None
+def canonical_value(value):
+    return value if value else None
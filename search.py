@@ -0,0 +1,251 @@
+import re
+import pandas as pd
+from metrics import timed
+from query_parser import normalize_query, parse_query_offline, parse_query_online
+from result_cache import canonical_players, canonical_value, get_result_cache
+
+# Ways the text search can use a query
+SEARCH_MODES = ["Filters", "Captions", "Semantic"]
+# Number of results shown when the query does not ask for a number of images
+DEFAULT_NUM_RESULTS = 6
+# Number of nearest images returned by the semantic search
+SEMANTIC_TOP_K = 60
+# Players, actions and activities offered by the filter tab
+AVAILABLE_PLAYERS = ["Mitchell Santner", "Nishant Sindhu", "Moeen Ali", "Ajay Mandal", "Ben Stokes",
+    "Ajinkya Rahane", "Shivam Dube", "Deepak Chahar", "Devon Conway", "Maheesh Theekshana",
+    "R Russell", "Akash Singh", "Gregory King", "Lakshmi", "Tushar Deshpande", "Ms Dhoni",
+    "Suresh Raina", "Ruturaj Gaikwad", "Simarjeet Singh", "Ravindra Jadeja", "Eric Simon",
+    "Shaik Rasheed", "Stephen Fleming", "Subhranshu Senapati", "Dwayne Bravo", "Ambati Rayudu",
+    "Bhagath Varma", "Tommy Simsek", "Sanjay Natarajan", "Prashant Solanki", "Rajvardhan Hangargekar",
+    "Dwaine Pretorius", "Matheesha Pathirana", "Mukesh Choudhary", "Kasi", "Gerald Coetzee",
+    "David Miller", "Faf Du Plessis", "Lahiru Milantha", "Imran Tahir", "Saiteja Mukkamalla",
+    "Rusty Theron", "Cameron Stevenson", "Zia Shahzad", "Cody Chetty", "Milind Kumar",
+    "Sami Aslam", "Calvin Savage", "Muhammad Mohsin", "Zia Ul Haq"]
+FILTER_ACTIONS = ["Award Ceremony", "Batting", "Bowling", "Catching", "Cheering", "Departure", "Eating", "Event",
+                  "Greeting", "Holding Signs", "Hugging", "Laughing", "Observing", "Playing", "Posing", "Practicing",
+                  "Receiving", "Running", "Smiling", "Speaking", "Standing", "Sitting", "Warm Up", "Walking"]
+FILTER_ACTIVITIES = ["Day", "Night", "Outdoor", "Indoor", "Unknown", "Close"]
+# Activity choices of the filter tab, by the column they filter on
+DAY_NIGHT_ACTIVITIES = ["Day", "Night"]
+ENVIRONMENT_ACTIVITIES = ["Outdoor", "Indoor"]
+DISTANCE_ACTIVITIES = ["Close", "Far"]
+
+
+# Function to get the bitmap of catalog images matching the structured filters
+# A TermCache can be passed as index to share term bitmaps between the queries of a batch.
+def filter_image_bitmap(catalog, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None, index=None):
+    if index is None:
+        index = catalog.search_index
+    # Start with all images
+    result = index.all()
+    # Check for generic player terms
+    generic_terms = {"players", "person", "people"}
+    if players and not generic_terms.intersection(set(map(str.lower, players))):
+        # Images holding every player: an intersection of their posting lists
+        result &= catalog.player_index.bitmap_with_all(players)
+    # Filter by action if specified
+    if action:
+        result &= index.exact("Action", action)
+    # Filter by environment if specified
+    if environment:
+        if "Environment" in index.postings:
+            result &= index.contains("Environment", environment)
+    # Filter by day/night if specified
+    if day_night:
+        if "Day/Night" in index.postings:
+            result &= index.contains("Day/Night", day_night)
+    # Filter by shot type if specified
+    if shot_type:
+        if "ShotType" in index.postings:
+            result &= index.contains("ShotType", shot_type)
+    # Filter by date if specified
+    if date:
+        if "DateText" in index.postings:
+            result &= index.contains("DateText", date)
+    # Filter by location if specified
+    if location:
+        if "Location" in index.postings:
+            result &= index.contains("Location", location)
+    return result
+
+
+# Updated function to filter the catalog using its precomputed search index
+def filter_images_by_players_and_action(catalog, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None):
+    filters = get_filter_key(players, action, environment, day_night, shot_type, date, location)
+
+    def compute():
+        result = filter_image_bitmap(catalog, players, action, environment, day_night, shot_type, date, location)
+        return catalog.search_index.urls_for(result)
+
+    return get_result_cache().get_or_compute(catalog.version, "text", filters, compute)
+
+
+# Function to get the images closest in meaning to the query among those matching the structured filters
+def search_images_semantically(catalog, user_query, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None, top_k=SEMANTIC_TOP_K):
+    result = filter_image_bitmap(catalog, players, action, environment, day_night, shot_type, date, location)
+    ranked = catalog.semantic_index.search(user_query, top_k, result)
+    return catalog.search_index.urls[ranked].tolist()
+
+
+# Function to rank the images matching the structured filters by how well their captions match the query.
+# When filters were given, the filtered images without a caption hit follow the ranked ones.
+def search_images_by_caption(catalog, user_query, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None):
+    filters = [players, action, environment, day_night, shot_type, date, location]
+    result = filter_image_bitmap(catalog, *filters)
+    ranked = catalog.caption_index.rank(user_query, result)
+    if any(filters):
+        result[ranked] = False
+        ranked = list(ranked) + list(result.nonzero()[0])
+    return catalog.search_index.urls[ranked].tolist()
+
+
+# Function to describe the images behind a list of URLs
+def describe_results(catalog, urls):
+    results = []
+    for url in urls:
+        record = catalog.records.by_url.get(url)
+        if record is None:
+            results.append({"url": url})
+        else:
+            results.append({"id": record.id, "url": url, "view_link": record.view_link, "players": sorted(record.players)})
+    return results
+
+
+# Function to get the number of results asked for in the query ("5 images of ...")
+def get_num_results(user_query):
+    match = re.search(r"\b(\d+)\s*images?\b", user_query)
+    return int(match.group(1)) if match else DEFAULT_NUM_RESULTS
+
+
+# Function to turn a query into search parameters without calling Gemini, or None when it needs Gemini
+def parse_search_query_offline(catalog, user_query, search_mode="Filters"):
+    if search_mode == "Captions":
+        # Only the players the local parser recognizes become filters. Action and attribute words are left to
+        # the caption ranking, since a caption often describes what the image's Action column does not.
+        return {"Players": catalog.query_parser.find_players(normalize_query(user_query))}
+    return parse_query_offline(user_query, catalog.query_parser)
+
+
+# Function to turn a query into search parameters, or None when Gemini's response holds no JSON
+def parse_search_query(catalog, user_query, search_mode="Filters"):
+    with timed("parse_query", mode=search_mode):
+        parsed_query = parse_search_query_offline(catalog, user_query, search_mode)
+        return parsed_query if parsed_query is not None else parse_query_online(user_query)
+
+
+# Function to guess the filters of a query that needs Gemini from the players, actions and attributes
+# the local parser recognizes in it, or None when it recognizes nothing
+def guess_search_query(catalog, user_query):
+    extracted = catalog.query_parser.extract(normalize_query(user_query))
+    if extracted is None:
+        return None
+    parsed_query = extracted[0]
+    return parsed_query if parsed_query["Players"] or len(parsed_query) > 1 else None
+
+
+# Function to get the structured filters of a parsed query, in the order filter_image_bitmap takes them
+def get_query_filters(parsed_query):
+    return [
+        parsed_query.get("Players", []),
+        parsed_query.get("Action", None),
+        parsed_query.get("Environment", None),
+        parsed_query.get("Day/Night", None),
+        parsed_query.get("ShotType", None),
+        parsed_query.get("Date", None),
+        parsed_query.get("Location", None),
+    ]
+
+
+# Function to turn structured filters into a key that is equal for filters returning the same images
+def get_filter_key(players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None):
+    return (canonical_players(players),) + tuple(map(canonical_value, [action, environment, day_night, shot_type, date, location]))
+
+
+# Function to run the text search for a parsed query and return the matching URLs
+def search_images(catalog, user_query, parsed_query, search_mode="Filters"):
+    filters = get_query_filters(parsed_query)
+    with timed("text_search", mode=search_mode):
+        if search_mode == "Captions":
+            return search_images_by_caption(catalog, user_query, *filters)
+        if search_mode == "Semantic":
+            return search_images_semantically(catalog, user_query, *filters)
+        return filter_images_by_players_and_action(catalog, *filters)
+
+
+# Function to filter dataframe based on action
+def filter_by_action(df, action):
+    return df[df["Action"].str.contains(action, case=False, na=False)]
+
+
+# Function to filter dataframe based on the number of faces
+def filter_by_no_of_faces(df, no_of_faces=0):
+    return df[df["No_of_faces"] == no_of_faces]
+
+
+# Function to filter dataframe based on the activity attributes
+def filter_by_activity(df, day_night=None, environment=None, distance=None):
+    if day_night:
+        df = df[df["Day/Night"].str.contains(day_night, case=False, na=False)]
+    if environment:
+        df = df[df["Environment"].str.contains(environment, case=False, na=False)]
+    if distance:
+        df = df[df["ShotType"].str.contains(distance, case=False, na=False)]
+    return df
+
+
+def filter_by_date(df, from_date, to_date):
+    # Convert the date inputs to pandas datetime; the catalog has already parsed the 'Date' column
+    from_date = pd.to_datetime(from_date.strftime("%Y-%m-%d"))
+    to_date = pd.to_datetime(to_date.strftime("%Y-%m-%d"))
+    # Filter the DataFrame for dates within the specified range
+    return df[(df["Date"] >= from_date) & (df["Date"] <= to_date)]
+
+
+# Function to filter players with the same URL
+def filter_by_same_url(catalog, df, players):
+    # Keep the URLs whose image holds all the selected players, from the players' posting lists
+    return df[df["URL"].isin(catalog.url_player_index.keys_with_all(players))]
+
+
+# Filter-based search: images holding all the selected players that match every given filter
+def filter_images(catalog, players, action=None, activity=None, from_date=None, to_date=None, no_of_faces=0):
+    # The date range only filters when both ends are set, and a face count of 0 means any
+    dates = (from_date, to_date) if from_date and to_date else (None, None)
+    filters = (canonical_players(players), canonical_value(action), canonical_value(activity)) + dates + (max(no_of_faces, 0),)
+
+    def compute():
+        with timed("filter_images"):
+            return _filter_images(catalog, players, action, activity, from_date, to_date, no_of_faces)
+
+    return get_result_cache().get_or_compute(catalog.version, "filter", filters, compute)
+
+
+def _filter_images(catalog, players, action, activity, from_date, to_date, no_of_faces):
+    df = catalog.df
+    # Filter by selected player names
+    filtered_df = df[df["Name"].isin(players)]
+    if action:
+        filtered_df = filter_by_action(filtered_df, action)
+    if activity:
+        filtered_df = filter_by_activity(
+            filtered_df,
+            day_night=activity if activity in DAY_NIGHT_ACTIVITIES else None,
+            environment=activity if activity in ENVIRONMENT_ACTIVITIES else None,
+            distance=activity if activity in DISTANCE_ACTIVITIES else None,
+        )
+    if no_of_faces > 0:
+        filtered_df = filter_by_no_of_faces(filtered_df, no_of_faces)
+    if from_date and to_date:
+        filtered_df = filter_by_date(filtered_df, from_date, to_date)
+    filtered_df = filter_by_same_url(catalog, filtered_df, players)
+    # Ensure only unique URLs
+    return filtered_df["URL"].drop_duplicates().tolist()
+
+
+# Function to get every image of the selected players, the filter tab's fallback when nothing matches
+def images_of_players(catalog, players):
+    df = catalog.df
+    return get_result_cache().get_or_compute(
+        catalog.version, "players", canonical_players(players),
+        lambda: df[df["Name"].isin(players)]["URL"].drop_duplicates().tolist(),
+    )
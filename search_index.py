@@ -0,0 +1,105 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Columns where an image can hold several values (one row per player in the image)
+MULTI_VALUE_COLUMNS = ["Name", "Action"]
+# Columns where the text search uses the first value recorded for the image
+SINGLE_VALUE_COLUMNS = ["Environment", "Day/Night", "ShotType", "DateText", "Location"]
+
+
+# Function to compile a pattern for case-insensitive substring matching, like str.contains(case=False).
+# Patterns come from Gemini and API callers, so one that is not a valid regex is matched as plain text.
+def compile_contains_pattern(pattern):
+    try:
+        return re.compile(pattern, flags=re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(pattern), flags=re.IGNORECASE)
+
+
+class SearchIndex:
+    """Inverted index from column values to bitmaps over the catalog's image IDs."""
+
+    def __init__(self, df):
+        codes, ids = pd.factorize(df["ID"], sort=True)
+        self.ids = np.asarray(ids)
+        self.size = len(self.ids)
+        first = df.groupby("ID", sort=True).first()
+        self.urls = first["URL"].to_numpy()
+        self.postings = {}
+        for column in MULTI_VALUE_COLUMNS:
+            if column in df.columns:
+                self.postings[column] = self._multi_value_postings(codes, df[column])
+        for column in SINGLE_VALUE_COLUMNS:
+            if column in first.columns:
+                self.postings[column] = self._single_value_postings(first[column])
+
+    def _multi_value_postings(self, codes, values):
+        pairs = pd.DataFrame({"code": codes, "value": values.astype(object)}).dropna().drop_duplicates()
+        postings = {}
+        for value, group in pairs.groupby("value", sort=False)["code"]:
+            bitmap = np.zeros(self.size, dtype=bool)
+            bitmap[group.to_numpy()] = True
+            postings[value] = bitmap
+        return postings
+
+    def _single_value_postings(self, values):
+        values = values.astype(object).to_numpy()
+        postings = {}
+        for value in pd.unique(values):
+            if not pd.isna(value):
+                postings[value] = values == value
+        return postings
+
+    def all(self):
+        return np.ones(self.size, dtype=bool)
+
+    def none(self):
+        return np.zeros(self.size, dtype=bool)
+
+    # Bitmap of images holding exactly this value
+    def exact(self, column, value):
+        bitmap = self.postings.get(column, {}).get(value)
+        return bitmap if bitmap is not None else self.none()
+
+    # Bitmap of images whose value contains the pattern (same rules as str.contains(case=False))
+    def contains(self, column, pattern):
+        regex = compile_contains_pattern(pattern)
+        bitmap = self.none()
+        for value, value_bitmap in self.postings.get(column, {}).items():
+            if regex.search(str(value)):
+                bitmap = bitmap | value_bitmap
+        return bitmap
+
+    def urls_for(self, bitmap):
+        return self.urls[bitmap].tolist()
+
+
+class TermCache:
+    """Remembers the bitmap of every term looked up in a search index, so a batch of queries computes each term once."""
+
+    def __init__(self, index):
+        self.index = index
+        self.postings = index.postings
+        self.bitmaps = {}
+
+    def all(self):
+        return self.index.all()
+
+    def none(self):
+        return self.index.none()
+
+    def exact(self, column, value):
+        key = ("exact", column, value)
+        if key not in self.bitmaps:
+            self.bitmaps[key] = self.index.exact(column, value)
+        return self.bitmaps[key]
+
+    def contains(self, column, pattern):
+        key = ("contains", column, pattern)
+        if key not in self.bitmaps:
+            self.bitmaps[key] = self.index.contains(column, pattern)
+        return self.bitmaps[key]
+
+    def urls_for(self, bitmap):
+        return self.index.urls_for(bitmap)
@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from duplicates import collapse_near_duplicates
+from images import start_thumbnail_fetches
+from metrics import increment, timed
+from query_parser import parse_query_online
+from records import get_drive_file_id
+from search import (get_filter_key, get_query_filters, guess_search_query, parse_search_query_offline,
+                    search_images)
+
+# The text search's Submit as overlapping stages instead of one after another:
+#   1. the query is parsed locally or from the query cache when possible;
+#   2. otherwise Gemini parses it on a worker thread while the filters the local parser recognizes are
+#      searched speculatively and the first page of that guess starts downloading;
+#   3. when Gemini agrees with the guess, its results and downloads are used as they are, so the wait is
+#      close to the longer of the parse and the downloads rather than their sum;
+#   4. the first page of the final results starts downloading before the grid is drawn, and the grid's
+#      placeholders fill in as each thumbnail lands.
+
+# Threads running the blocking parse and search steps. They are not asyncio.run's default executor,
+# which it waits for on exit, so a dropped speculative search never holds up the page.
+PIPELINE_WORKERS = 4
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="text-search")
+
+
+# Function to run a blocking function on the pipeline threads, in a copy of the caller's context so its
+# timings join the caller's trace
+async def run_blocking(function):
+    return await asyncio.get_running_loop().run_in_executor(_executor, contextvars.copy_context().run, function)
+
+
+# Function to run the search for a parsed query on a worker thread and start fetching its first page
+async def find_results(catalog, user_query, parsed_query, search_mode, hide_duplicates, page_size):
+    def run():
+        result_urls = search_images(catalog, user_query, parsed_query, search_mode)
+        if hide_duplicates:
+            result_urls = collapse_near_duplicates(catalog, result_urls)
+        start_thumbnail_fetches([get_drive_file_id(url) for url in result_urls[:page_size] if "drive.google.com" in url])
+        return result_urls
+
+    return await run_blocking(run)
+
+
+# Function to cancel a speculative search that is no longer needed and wait for it to stop, so its
+# outcome, including any exception, is consumed
+async def drop_speculation(speculation):
+    speculation.cancel()
+    await asyncio.gather(speculation, return_exceptions=True)
+
+
+# Function to run one text search. Returns the result URLs, or None when Gemini's response holds no JSON.
+async def run_text_search(catalog, user_query, search_mode="Filters", hide_duplicates=False, page_size=6):
+    parsed_query = parse_search_query_offline(catalog, user_query, search_mode)
+    if parsed_query is not None:
+        return await find_results(catalog, user_query, parsed_query, search_mode, hide_duplicates, page_size)
+
+    def parse_online():
+        with timed("parse_query", mode=search_mode):
+            return parse_query_online(user_query)
+
+    parse_task = asyncio.create_task(run_blocking(parse_online))
+    guess = guess_search_query(catalog, user_query)
+    speculation = None
+    if guess is not None:
+        speculation = asyncio.create_task(find_results(catalog, user_query, guess, search_mode, hide_duplicates, page_size))
+    try:
+        parsed_query = await parse_task
+    except BaseException:
+        if speculation is not None:
+            await drop_speculation(speculation)
+        raise
+    if speculation is not None:
+        if parsed_query is not None and get_filter_key(*get_query_filters(parsed_query)) == get_filter_key(*get_query_filters(guess)):
+            increment("speculative_searches_total", result="hit")
+            return await speculation
+        increment("speculative_searches_total", result="miss")
+        # Its downloads, if any started, still fill the thumbnail cache
+        await drop_speculation(speculation)
+    if parsed_query is None:
+        return None
+    return await find_results(catalog, user_query, parsed_query, search_mode, hide_duplicates, page_size)
@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from caption_index import parse_captions
+
+# Local sentence embedding model, small enough to run on CPU
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Inverted-file lists probed per query; more lists are more accurate and slower
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+
+_model = None
+_model_lock = threading.Lock()
+
+
+# Function to get the embedding model, loaded once per process.
+# sentence-transformers is only needed by the semantic search, so it is imported here.
+def get_embedding_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError("Semantic search needs sentence-transformers: pip install sentence-transformers") from e
+                _model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    return _model
+
+
+# Function to embed texts as unit-length float32 vectors
+def embed(texts):
+    vectors = get_embedding_model().encode(list(texts), batch_size=64, normalize_embeddings=True,
+                                           convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+# Paths of the caption vectors (memory-mapped) and of the IVF metadata saved next to the catalog CSV
+def semantic_index_paths(csv_path):
+    base = os.path.splitext(csv_path)[0]
+    return base + ".embeddings.npy", base + ".embeddings.npz"
+
+
+# Plain k-means on unit vectors (spherical k-means), returning centroids and each vector's list
+def train_ivf(vectors, nlist, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for list_id in range(nlist):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[list_id] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class SemanticIndex:
+    """IVF index over caption embeddings; an image scores the best similarity of any of its captions."""
+
+    def __init__(self, vectors, owners, centroids, offsets, size):
+        # Vectors are grouped by IVF list: list i holds rows offsets[i]:offsets[i + 1]
+        self.vectors = vectors
+        self.owners = owners
+        self.centroids = centroids
+        self.offsets = offsets
+        self.size = size
+
+    # Offline step: embed every distinct caption of every image, in the order of ids
+    @classmethod
+    def build(cls, df, ids):
+        positions = pd.Index(ids).get_indexer(df["ID"])
+        captions = {}
+        for position, value in zip(positions, df["Captions"]):
+            for caption in parse_captions(value):
+                captions.setdefault((position, caption), None)
+        owners = np.array([position for position, _ in captions], dtype=np.int32)
+        vectors = embed(caption for _, caption in captions)
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        centroids, assignments = train_ivf(vectors, nlist)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(nlist + 1)).astype(np.int64)
+        return cls(vectors[order], owners[order], centroids, offsets, len(ids))
+
+    def save(self, csv_path, source_mtime):
+        vectors_path, meta_path = semantic_index_paths(csv_path)
+        # Write to temporary files first so other workers never map a half-written index
+        np.save(f"{vectors_path}.{os.getpid()}.tmp.npy", self.vectors)
+        np.savez(f"{meta_path}.{os.getpid()}.tmp.npz", owners=self.owners, centroids=self.centroids,
+                 offsets=self.offsets, size=np.array(self.size), source_mtime=np.array(source_mtime),
+                 model=np.array(EMBEDDING_MODEL))
+        os.replace(f"{vectors_path}.{os.getpid()}.tmp.npy", vectors_path)
+        os.replace(f"{meta_path}.{os.getpid()}.tmp.npz", meta_path)
+
+    # Function to map a saved index, or None when it is missing or was built from another version of the CSV
+    @classmethod
+    def load(cls, csv_path, source_mtime, size):
+        vectors_path, meta_path = semantic_index_paths(csv_path)
+        try:
+            with np.load(meta_path) as meta:
+                if float(meta["source_mtime"]) != source_mtime or int(meta["size"]) != size:
+                    return None
+                if str(meta["model"]) != EMBEDDING_MODEL:
+                    return None
+                owners, centroids, offsets = meta["owners"], meta["centroids"], meta["offsets"]
+            # Read-only memory map: the pages are shared by every worker process on the machine
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (OSError, KeyError, ValueError):
+            return None
+        return cls(vectors, owners, centroids, offsets, size)
+
+    # Positions of the k images closest to the query, best first, optionally restricted to a bitmap
+    def search(self, text, k, mask=None, nprobe=DEFAULT_NPROBE):
+        query = embed([text])[0]
+        probed = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in probed])
+        if mask is not None:
+            rows = rows[mask[self.owners[rows]]]
+            if len(np.unique(self.owners[rows])) < k:
+                # The filters left too few candidates in the probed lists: score every caption they allow
+                rows = np.flatnonzero(mask[self.owners])
+        similarities = np.asarray(self.vectors[rows]) @ query
+        scores = np.full(self.size, -np.inf, dtype=np.float32)
+        np.maximum.at(scores, self.owners[rows], similarities)
+        hits = np.flatnonzero(scores > -np.inf)
+        return hits[np.argsort(-scores[hits], kind="stable")][:k]
+
+
+# Offline build step: python semantic_index.py [repo1.csv]
+if __name__ == "__main__":
+    from catalog import CSV_FILE_PATH, get_catalog
+    catalog = get_catalog(sys.argv[1] if len(sys.argv) > 1 else CSV_FILE_PATH)
+    index = SemanticIndex.build(catalog.df, catalog.search_index.ids)
+    index.save(catalog.path, catalog.mtime)
+    print(f"Embedded {len(index.vectors)} captions into {len(index.centroids)} lists, saved to {semantic_index_paths(catalog.path)[0]}")
@@ -0,0 +1,52 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+from catalog import get_catalog, prepare_catalog_frame, read_catalog_frame
+from catalog_store import append_new_rows, read_store_frame, store_path, sync_csv_rows
+
+
+# A copy of the sample catalog whose first image has no captions
+@pytest.fixture
+def catalog_copy(tmp_path, csv_path):
+    path = str(tmp_path / "repo1.csv")
+    shutil.copy(csv_path, path)
+    df = pd.read_csv(path)
+    df.loc[0, "Captions"] = None
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_sync_without_changes_writes_nothing(catalog_copy):
+    path = store_path(catalog_copy)
+    action, rows = sync_csv_rows(path, read_catalog_frame(catalog_copy))
+    assert action == "created"
+    assert sync_csv_rows(path, read_catalog_frame(catalog_copy)) == ("appended", 0)
+    assert len(read_store_frame(path)) == rows
+
+
+def test_sync_appends_new_csv_rows(catalog_copy):
+    path = store_path(catalog_copy)
+    sync_csv_rows(path, read_catalog_frame(catalog_copy))
+    df = pd.read_csv(catalog_copy)
+    new_row = df.iloc[[1]].assign(ID="new.jpg", URL="https://example.com/new.jpg")
+    pd.concat([df, new_row]).to_csv(catalog_copy, index=False)
+    assert sync_csv_rows(path, read_catalog_frame(catalog_copy)) == ("appended", 1)
+    assert len(read_store_frame(path)) == len(df) + 1
+
+
+def test_csv_edit_keeps_ingested_rows(catalog_copy):
+    path = store_path(catalog_copy)
+    sync_csv_rows(path, read_catalog_frame(catalog_copy))
+    df = pd.read_csv(catalog_copy)
+    ingested = prepare_catalog_frame(df.iloc[[1]].assign(ID="DSC0001.jpg", URL="/photos/DSC0001.jpg"))
+    assert append_new_rows(path, ingested) == 1
+    # Edit a cell after the ingestion, leaving the CSV newer than the store
+    df.loc[2, "Location"] = "Mumbai"
+    df.to_csv(catalog_copy, index=False)
+    os.utime(catalog_copy, (os.path.getmtime(path) + 10,) * 2)
+    catalog = get_catalog(catalog_copy)
+    assert len(catalog.df) == len(df) + 1
+    assert "/photos/DSC0001.jpg" in set(catalog.df["URL"])
+    assert catalog.df.loc[2, "Location"] == "Mumbai"
+    assert catalog.df["Name"].dtype == "category"
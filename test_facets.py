@@ -0,0 +1,69 @@
+import datetime
+import random
+from duplicates import DuplicateIndex
+from facets import FacetSelection, facet_counts
+from search import AVAILABLE_PLAYERS, FILTER_ACTIONS, FILTER_ACTIVITIES, filter_images
+
+
+# Random filter tab states: one or two of the most photographed players and sometimes an action, activity,
+# face count or date range
+def random_choices(rng, catalog):
+    frequent = [name for name in catalog.df["Name"].value_counts().index[:8] if name in AVAILABLE_PLAYERS]
+    dates = rng.choice([(None, None), (None, None), (datetime.date(2023, 5, 1), datetime.date(2023, 5, 31))])
+    return {
+        "players": rng.sample(frequent, rng.choice([1, 1, 2])),
+        "action": rng.choice([None, None] + FILTER_ACTIONS),
+        "activity": rng.choice([None, None] + FILTER_ACTIVITIES),
+        "from_date": dates[0],
+        "to_date": dates[1],
+        "no_of_faces": rng.choice([0, 0, 0, 1, 2]),
+    }
+
+
+def test_counts_match_filter_images(catalog):
+    rng = random.Random(11)
+    for _ in range(30):
+        choices = random_choices(rng, catalog)
+        players = choices.pop("players")
+        selection = FacetSelection(catalog.facet_index)
+        selection.sync(players)
+        counts = facet_counts(selection, **choices)
+        assert counts["total"] == len(filter_images(catalog, players, **choices))
+        for action in FILTER_ACTIONS:
+            expected = len(filter_images(catalog, players, **{**choices, "action": action}))
+            assert counts["Action"][action] == expected, (players, choices, action)
+        for activity in FILTER_ACTIVITIES:
+            expected = len(filter_images(catalog, players, **{**choices, "activity": activity}))
+            assert counts["Activity"][activity] == expected, (players, choices, activity)
+        for player, count in counts["Players"].items():
+            assert count == len(filter_images(catalog, players + [player], **choices)), (players, choices, player)
+
+
+def test_selection_follows_player_changes(catalog):
+    selection = FacetSelection(catalog.facet_index)
+    selection.sync(["Ms Dhoni", "Ravindra Jadeja"])
+    selection.sync(["Ravindra Jadeja"])
+    fresh = FacetSelection(catalog.facet_index)
+    fresh.sync(["Ravindra Jadeja"])
+    assert facet_counts(selection) == facet_counts(fresh)
+    assert facet_counts(selection)["total"] == len(filter_images(catalog, ["Ravindra Jadeja"]))
+
+
+def test_counts_with_duplicates_hidden_match_collapsed_results(catalog):
+    # Synthetic hashes putting runs of neighbouring images into near-duplicate groups, with every fifth image unhashed
+    urls = catalog.facet_index.urls
+    duplicate_index = DuplicateIndex({url: (i // 4) * 0x0101010101010101 for i, url in enumerate(urls) if i % 5})
+    url_groups = catalog.facet_index.url_groups(duplicate_index)
+    rng = random.Random(13)
+    for _ in range(20):
+        choices = random_choices(rng, catalog)
+        players = choices.pop("players")
+        selection = FacetSelection(catalog.facet_index)
+        selection.sync(players)
+        counts = facet_counts(selection, url_groups=url_groups, **choices)
+        assert counts["total"] == len(duplicate_index.collapse(filter_images(catalog, players, **choices)))
+        for action in FILTER_ACTIONS:
+            expected = duplicate_index.collapse(filter_images(catalog, players, **{**choices, "action": action}))
+            assert counts["Action"][action] == len(expected), (players, choices, action)
+        for player, count in counts["Players"].items():
+            assert count == len(duplicate_index.collapse(filter_images(catalog, players + [player], **choices)))
@@ -0,0 +1,44 @@
+import io
+import numpy as np
+from PIL import Image
+from placeholders import (COMPONENTS_X, COMPONENTS_Y, PLACEHOLDER_SIZE, decode_blurhash, encode_blurhash,
+                          placeholder_image)
+
+
+# A horizontal gradient from dark red to light blue
+def gradient_image(width=96, height=64):
+    ramp = np.linspace(0, 1, width)[None, :, None]
+    pixels = (1 - ramp) * np.array([120, 20, 20]) + ramp * np.array([60, 140, 230])
+    return Image.fromarray(np.repeat(pixels, height, axis=0).astype(np.uint8))
+
+
+def test_round_trip_keeps_average_color_and_layout():
+    image = gradient_image()
+    blurhash = encode_blurhash(image)
+    assert len(blurhash) == 4 + 2 * COMPONENTS_X * COMPONENTS_Y
+    pixels = decode_blurhash(blurhash, 48, 32)
+    assert pixels.shape == (32, 48, 3)
+    assert np.abs(pixels.mean(axis=(0, 1)) - np.asarray(image).mean(axis=(0, 1))).max() < 12
+    # The gradient's direction survives: red falls and blue rises from left to right
+    assert pixels[:, 0, 0].mean() > pixels[:, -1, 0].mean()
+    assert pixels[:, 0, 2].mean() < pixels[:, -1, 2].mean()
+
+
+def test_encoded_bytes_match_image():
+    image = gradient_image()
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    assert encode_blurhash(output.getvalue()) == encode_blurhash(image)
+
+
+def test_flat_image_keeps_its_color():
+    blurhash = encode_blurhash(Image.new("RGB", (40, 30), (200, 100, 50)))
+    assert np.abs(decode_blurhash(blurhash, 40, 30).mean(axis=(0, 1)) - [200, 100, 50]).max() < 4
+
+
+def test_placeholder_image_of_broken_blurhash_is_none():
+    assert placeholder_image(None) is None
+    assert placeholder_image("") is None
+    assert placeholder_image("LKO2?U%2") is None
+    preview = Image.open(io.BytesIO(placeholder_image(encode_blurhash(gradient_image()))))
+    assert preview.size == PLACEHOLDER_SIZE
@@ -0,0 +1,39 @@
+from query_parser import LocalQueryParser, normalize_query
+from search import parse_search_query_offline, search_images
+
+PLAYERS = ["Ms Dhoni", "Ravindra Jadeja", "Suresh Raina"]
+
+
+def parse(user_query):
+    return LocalQueryParser(PLAYERS, ["Chennai"]).parse(normalize_query(user_query))
+
+
+def test_simple_queries_are_parsed_locally():
+    assert parse("Dhoni batting") == {"Players": ["Ms Dhoni"], "Action": "batting"}
+    assert parse("photos of Jadeja and Raina at night in Chennai") == {
+        "Players": ["Ravindra Jadeja", "Suresh Raina"], "Day/Night": "night", "Location": "Chennai"}
+
+
+def test_result_count_is_ignored():
+    assert parse("10 images of Dhoni batting") == {"Players": ["Ms Dhoni"], "Action": "batting"}
+    assert parse("Dhoni 5images") == {"Players": ["Ms Dhoni"]}
+
+
+def test_dates_go_to_gemini():
+    assert parse("dhoni batting 21 05 2023") is None
+    assert parse("MS Dhoni 2023") is None
+    assert parse("Dhoni 8/5/2023") is None
+    assert parse("3 images of Dhoni on 8/5/2023") is None
+
+
+def test_find_players_ignores_other_fields():
+    parser = LocalQueryParser(PLAYERS, ["Chennai"])
+    assert parser.find_players(normalize_query("Raina and Dhoni walking in Chennai")) == ["Suresh Raina", "Ms Dhoni"]
+
+
+def test_caption_search_filters_only_by_players(catalog):
+    parsed_query = parse_search_query_offline(catalog, "walking hotel luggage", "Captions")
+    assert parsed_query == {"Players": []}
+    # The top caption is "some men walking to their hotel with luggage", on an image whose Action is posing
+    assert search_images(catalog, "walking hotel luggage", parsed_query, "Captions")[0] == \
+        catalog.records.by_id["PXL_20230521_084729018.jpg"].url
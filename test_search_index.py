@@ -0,0 +1,57 @@
+import random
+import pandas as pd
+import pytest
+from search import filter_images_by_players_and_action
+
+# The text search as it was before the inverted index: group the rows by image, then filter the groups
+def groupby_filter(df, players=None, action=None, environment=None, day_night=None, shot_type=None, date=None, location=None):
+    grouped = df.groupby("ID").agg(
+        {"Name": lambda x: set(x), "URL": "first", "Action": lambda x: set(x), "Environment": "first",
+         "Day/Night": "first", "ShotType": "first", "Date": "first", "Location": "first"}
+    )
+    result = grouped
+    generic_terms = {"players", "person", "people"}
+    if players and not generic_terms.intersection(set(map(str.lower, players))):
+        result = result[result["Name"].apply(lambda x: set(players).issubset(x))]
+    # An empty frame's apply() gives an object Series that would select columns, so stop once nothing is left
+    if action and len(result):
+        result = result[result["Action"].apply(lambda x: action in x)]
+    for column, pattern in [("Environment", environment), ("Day/Night", day_night), ("ShotType", shot_type),
+                            ("Date", date), ("Location", location)]:
+        if pattern:
+            result = result[result[column].str.contains(pattern, case=False, na=False)]
+    return result["URL"].tolist()
+
+
+@pytest.fixture(scope="module")
+def raw_df(csv_path):
+    return pd.read_csv(csv_path)
+
+
+# Random filters on one to three dimensions, so most queries still match some images
+def random_filters(rng, df):
+    choices = {
+        "players": [[name] for name in df["Name"].dropna().unique()] + [rng.sample(sorted(df["Name"].dropna().unique()), 2)],
+        "action": df["Action"].dropna().unique().tolist(),
+        "environment": ["outdoor", "indoor", "OUT"],
+        "day_night": ["day", "night"],
+        "shot_type": ["close", "far"],
+        "date": ["2023", "/5/", "21/05/2023"],
+        "location": ["Chennai", "chen"],
+    }
+    return {name: rng.choice(choices[name]) for name in rng.sample(sorted(choices), rng.randint(1, 3))}
+
+
+def test_matches_groupby_filter(catalog, raw_df):
+    rng = random.Random(7)
+    for _ in range(200):
+        filters = random_filters(rng, raw_df)
+        assert filter_images_by_players_and_action(catalog, **filters) == groupby_filter(raw_df, **filters), filters
+
+
+def test_generic_player_terms_do_not_filter(catalog, raw_df):
+    assert filter_images_by_players_and_action(catalog, players=["People"]) == groupby_filter(raw_df)
+
+
+def test_invalid_pattern_is_matched_as_text(catalog):
+    assert filter_images_by_players_and_action(catalog, location="(") == []
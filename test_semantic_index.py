@@ -0,0 +1,18 @@
+import shutil
+import numpy as np
+from catalog import get_catalog
+from semantic_index import SemanticIndex
+
+
+def test_index_built_while_running_is_picked_up(tmp_path, csv_path):
+    path = str(tmp_path / "repo1.csv")
+    shutil.copy(csv_path, path)
+    catalog = get_catalog(path)
+    assert catalog.semantic_index is None
+    # What python semantic_index.py saves, with random vectors standing in for caption embeddings
+    size = catalog.search_index.size
+    vectors = np.random.default_rng(0).normal(size=(size, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    SemanticIndex(vectors, np.arange(size, dtype=np.int32), vectors[:1], np.array([0, size]), size).save(path, catalog.mtime)
+    assert get_catalog(path) is catalog
+    assert catalog.semantic_index is not None
@@ -0,0 +1,112 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+# Width in pixels of the stored thumbnails: a grid column at 2x pixel density
+THUMBNAIL_WIDTH = 480
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_QUALITY = 80
+
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+# Function to shrink a full-resolution image to a WebP thumbnail of the given width
+def make_thumbnail(image_content, width=THUMBNAIL_WIDTH):
+    image = Image.open(io.BytesIO(image_content))
+    # Let the JPEG decoder scale down by up to 8x while decoding, keeping the width needed after rotation.
+    # This has to happen before exif_transpose, which decodes the image.
+    if image.format == "JPEG":
+        transposed = image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS
+        image.draft("RGB", (1, width) if transposed else (width, 1))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    image.thumbnail((width, width * 4))
+    output = io.BytesIO()
+    image.save(output, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """Directory of thumbnails keyed by Drive file ID, evicting the least recently used past max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # file ID -> size in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_entries()
+
+    # Rebuild the LRU order from the files left by earlier runs, using their mtime as last access
+    def _load_entries(self):
+        suffix = "." + THUMBNAIL_FORMAT.lower()
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(suffix):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(suffix)], stat.st_size))
+        for _, file_id, size in sorted(files):
+            self.entries[file_id] = size
+            self.total_bytes += size
+        with self.lock:
+            self._evict()
+
+    def path_for(self, file_id):
+        return os.path.join(self.directory, f"{file_id}.{THUMBNAIL_FORMAT.lower()}")
+
+    # Check the disk rather than the in-memory entries, which miss thumbnails written by other processes
+    def contains(self, file_id):
+        return os.path.exists(self.path_for(file_id))
+
+    # Function to read a cached thumbnail, or None when it is not cached
+    def get(self, file_id):
+        path = self.path_for(file_id)
+        try:
+            with open(path, "rb") as f:
+                thumbnail = f.read()
+            # Touch the file so the LRU order survives restarts
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self._forget(file_id)
+            return None
+        with self.lock:
+            if file_id not in self.entries:
+                self.total_bytes += len(thumbnail)
+            self.entries[file_id] = len(thumbnail)
+            self.entries.move_to_end(file_id)
+        return thumbnail
+
+    # Function to store an already-encoded thumbnail
+    def put(self, file_id, thumbnail):
+        path = self.path_for(file_id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(thumbnail)
+        os.replace(temp_path, path)
+        with self.lock:
+            self._forget(file_id)
+            self.entries[file_id] = len(thumbnail)
+            self.total_bytes += len(thumbnail)
+            self._evict()
+
+    def _forget(self, file_id):
+        size = self.entries.pop(file_id, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            file_id, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(file_id))
+            except FileNotFoundError:
+                pass